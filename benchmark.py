@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Benchmark: This file times and memory profiles every analysis stage on synthetic logs of several sizes
+Version: 1.1
+Changelog:
+    v1.1        Stage benchmarks with json results
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+import numpy as np
+import pandas as pd
+
+try:
+    from config import *
+    from config import __prog__, __version__
+except:
+    print('* Config file not found! Error!')
+    sys.exit(1)
+
+try:
+    from utils import is_dirs
+except:
+    print('* Utils file not found! Error!')
+    sys.exit(1)
+
+try:
+    import firewall_log_analysis
+    import o365_log_analysis
+    import o365_anomalies
+except:
+    print('* Analyser files not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_profiler import StageProfiler
+except:
+    print('* Stage profiler file not found! Error!')
+    sys.exit(1)
+
+try:
+    from generate_synthetic_logs import generate_firewall_log, generate_o365_log
+except:
+    print('* Synthetic log generator file not found! Error!')
+    sys.exit(1)
+
+ANALYSERS = ['firewall', 'o365', 'anomalies']
+
+
+def firewall_stages(file_name):
+    fa = firewall_log_analysis.FirewallLogAnalyzer()
+    return [('read_csv_file', lambda: fa.read_csv_file(file_name)),
+            ('verify_columns', fa.verify_columns),
+            ('datetime_index', fa.datetime_index),
+            ('src_ip_analysis', fa.src_ip_analysis),
+            ('dest_ip_analysis', fa.dest_ip_analysis),
+            ('write_outputs', fa.writer.close)]
+
+
+def o365_stages(file_name):
+    ola = o365_log_analysis.O365LogAnalyzer()
+    failed = {}
+
+    def failed_logins():
+        failed['df'] = ola.failed_logins()
+
+    def split_device_info_column():
+        failed['devices'] = ola.split_device_info_column(failed['df'])
+
+    return [('read_csv_file', lambda: ola.read_csv_file(file_name)),
+            ('verify_columns', ola.verify_columns),
+            ('sort_by_time', ola.sort_by_time),
+            ('datetime_index', ola.datetime_index),
+            ('failed_successful_login_count', ola.failed_successful_login_count),
+            ('failed_logins', failed_logins),
+            ('split_device_info_column', split_device_info_column),
+            ('failed_login_based_on_os', lambda: ola.failed_login_based_on_os(failed['devices'])),
+            ('failed_login_based_on_ip', lambda: ola.failed_login_based_on_ip(failed['df'])),
+            ('max_login_failure_time_window', lambda: ola.max_login_failure_time_window(failed['df'])),
+            ('write_outputs', ola.writer.close)]
+
+
+def anomalies_stages(file_name):
+    oad = o365_anomalies.O365AnomalyDetector()
+
+    def users_and_dates():
+        oad.login_date = np.sort(oad.data['login_date'].value_counts().index.values)
+        oad.users_list = o365_anomalies.values_by_count(oad.data['user'])
+
+    return [('read_csv_file', lambda: oad.read_csv_file(file_name)),
+            ('verify_columns', oad.verify_columns),
+            ('sort_by_time', oad.sort_by_time),
+            ('extract_date_hour', oad.extract_date_hour),
+            ('users_and_dates', users_and_dates),
+            ('user_ip_switch', oad.user_ip_switch),
+            ('ipadr_based_outliers', oad.ipadr_based_outliers),
+            ('user_login_anomaly', oad.user_login_anomaly),
+            ('write_outputs', oad.writer.close)]
+
+
+def run_stages(analyser, stages, rows, repeat, trace_memory):
+    """
+    Run the stages of an analyser in order. A stage that fails or raises
+    is recorded with its status and the rest of the analyser is skipped.
+    :return: list of result records, one per stage run
+    """
+    profiler = StageProfiler(analyser, None, None, trace_memory)
+    records = []
+    for name, stage in stages:
+        error = None
+        try:
+            with profiler.stage(name, rows) as measures:
+                result = stage()
+        except (Exception, SystemExit) as e:
+            # SystemExit: the analysers exit on a missing resource, eg: the GeoLite database
+            result, error = None, e
+        record = {'analyser': analyser, 'stage': name, 'rows': rows, 'repeat': repeat,
+                  'status': 'failed' if result is False else measures['status']}
+        record.update({key: measures[key] for key in ('wall_s', 'cpu_s', 'peak_alloc_bytes', 'max_rss_bytes')})
+        if error is not None:
+            record['error'] = '{}: {}'.format(type(error).__name__, error)
+        records.append(record)
+        print('* {:<10} {:<30} {:>10} rows  {:>9.3f}s wall  {:>9.3f}s cpu  {}'.format(
+            analyser, name, rows, measures['wall_s'], measures['cpu_s'],
+            '' if measures['peak_alloc_bytes'] is None else
+            '{:.1f} MiB peak'.format(measures['peak_alloc_bytes'] / 1024 ** 2)), flush=True)
+        if record['status'] != 'ok':
+            print('* Stage {} {}, skipping the rest of {}{}'.format(
+                name, record['status'], analyser, '' if error is None else ': ' + record['error']))
+            break
+    profiler.stop()
+    return records
+
+
+def machine_info():
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'version': __version__}
+    try:
+        import sklearn
+        info['sklearn'] = sklearn.__version__
+    except:
+        pass
+    try:
+        info['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                                 cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except:
+        pass
+    return info
+
+
+def compare(results, baseline_file):
+    """
+    Print the wall time of every stage against a previous run
+    :param results: results of this run
+    :param baseline_file: json file of a previous run
+    :return:
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    def best(records):
+        df = pd.DataFrame(records)
+        if 'status' in df:
+            df = df[df['status'] == 'ok']
+        return df.groupby(['analyser', 'stage', 'rows'], sort=False)['wall_s'].min()
+    current, previous = best(results['records']), best(baseline['records'])
+    print('* Compared with {} ({})'.format(baseline_file, baseline['machine'].get('commit', 'unknown commit')))
+    for (analyser, stage, rows), wall in current.items():
+        before = previous.get((analyser, stage, rows))
+        if before is None:
+            continue
+        print('* {:<10} {:<30} {:>10} rows  {:>9.3f}s -> {:>9.3f}s  x{:.2f}'.format(
+            analyser, stage, rows, before, wall, wall / before if before else float('inf')))
+
+
+def run_benchmark(args):
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='loganalyser_bench_')
+    output_dir = tempfile.mkdtemp(prefix='loganalyser_bench_out_')
+    for module in (firewall_log_analysis, o365_log_analysis, o365_anomalies):
+        module.OUTPUT_DIR = module.ML_DIR = output_dir
+        module.N_JOBS = args.jobs
+    if not os.access(data_dir, os.F_OK):
+        os.makedirs(data_dir)
+    records = []
+    try:
+        for rows in args.rows:
+            # the file names carry the generator arguments, so reused logs always match them
+            suffix = '{}_{}_{}_{}_{}_{}.csv'.format(rows, args.users, args.ips, args.days, args.skew, args.seed)
+            fw_log = os.path.join(data_dir, 'firewall_' + suffix)
+            o365_log = os.path.join(data_dir, 'o365_' + suffix)
+            if 'firewall' in args.analysers and not os.access(fw_log, os.F_OK):
+                generate_firewall_log(fw_log, rows, ips=args.ips, days=args.days, skew=args.skew, seed=args.seed)
+            if {'o365', 'anomalies'} & set(args.analysers) and not os.access(o365_log, os.F_OK):
+                generate_o365_log(o365_log, rows, users=args.users, ips=args.ips, days=args.days, skew=args.skew,
+                                  seed=args.seed)
+            for repeat in range(args.repeat):
+                if 'firewall' in args.analysers:
+                    records += run_stages('firewall', firewall_stages(fw_log), rows, repeat, args.memory)
+                if 'o365' in args.analysers:
+                    records += run_stages('o365', o365_stages(o365_log), rows, repeat, args.memory)
+                if 'anomalies' in args.analysers:
+                    records += run_stages('anomalies', anomalies_stages(o365_log), rows, repeat, args.memory)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    return {'machine': machine_info(), 'params': params, 'records': records}
+
+
+if __name__ == '__main__':
+    print('* {}  v{}: Benchmark'.format(__prog__, __version__))
+    parser = argparse.ArgumentParser(description=__prog__, prog=__prog__)
+    parser.add_argument('-r', '--rows', nargs='+', default=[10000, 100000], type=int,
+                        help='Log sizes to benchmark, eg: 10000 100000 1000000')
+    parser.add_argument('-a', '--analysers', nargs='+', default=ANALYSERS, choices=ANALYSERS)
+    parser.add_argument('-u', '--users', default=1000, type=int, help='Number of distinct users')
+    parser.add_argument('--ips', default=10000, type=int, help='Number of distinct IPs')
+    parser.add_argument('--days', default=1, type=float, help='Time span of the logs in days')
+    parser.add_argument('--skew', default=1.0, type=float, help='Zipf exponent of the users, IPs and ports')
+    parser.add_argument('--seed', default=0, type=int, help='Seed of the synthetic logs')
+    parser.add_argument('-j', '--jobs', default=N_JOBS, type=int, help='Number of worker processes')
+    parser.add_argument('--repeat', default=1, type=int, help='Number of runs of every analyser')
+    parser.add_argument('--memory', action='store_true',
+                        help='Measure the peak memory allocated by every stage (slows the stages down)')
+    parser.add_argument('--data-dir', help='Keep the synthetic logs in this folder and reuse them')
+    parser.add_argument('-o', '--output', help='Json results file (default: OUTPUT_DIR/benchmark_<time>.json)')
+    parser.add_argument('--compare', help='Json results of a previous run to compare with')
+    args = parser.parse_args()
+
+    if not os.access(RESOURCES_DIR, os.F_OK):
+        print("* Error accessing '{}' folder! Exiting...!".format(RESOURCES_DIR))
+        sys.exit(1)
+
+    is_dirs(OUTPUT_DIR)
+    output = args.output or os.path.join(
+        OUTPUT_DIR, 'benchmark_' + datetime.datetime.now().strftime('%Y%m%d%H%M%S') + '.json')
+    results = run_benchmark(args)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print('* Results: {}'.format(output))
+    if args.compare:
+        compare(results, args.compare)
@@ -14,8 +14,9 @@ import os
 import time
 import sys
 import io
+import argparse
 import requests
-from joblib import dump
+from joblib import dump, load
 import radix
 try:
     import re2 as re
@@ -23,11 +24,17 @@ except:
     import re
 
 try:
-    from config import IP_ASN_URL, ASN_ISP_URL, IP_ISP_RTREE_JOBLIB
+    from config import IP_ASN_URL, ASN_ISP_URL, IP_ISP_RTREE_JOBLIB, IP_ISP_INDEX
 except:
     print('* Config file not found! Error!')
     sys.exit(1)
 
+try:
+    from ip_index import ISPBuilder
+except:
+    print('* IP index file not found! Error!')
+    sys.exit(1)
+
 
 def download_file(url):
     try:
@@ -55,6 +62,7 @@ def create_ip_to_asn_dict():
     asn_isp_dic = create_asn_to_isp_dict()
     data = download_file(IP_ASN_URL)
     rtree = radix.Radix()
+    isp_builder = ISPBuilder()
     try:
         for row in data:
             tokens = row.split('\t')
@@ -63,14 +71,31 @@ def create_ip_to_asn_dict():
                 rnode.data['isp'] = asn_isp_dic[int(tokens[1].strip())]
             except:
                 rnode.data['isp'] = 'UNKNOWN'
-        return rtree
+            isp_builder.add(rnode.prefix, rnode.data['isp'])
+        return rtree, isp_builder
     except Exception as e:
         print('* ERROR IN CREATING RADIX TREE : ', e)
         sys.exit(1)
 
 def dump_radix_tree():
-    rtree = create_ip_to_asn_dict()
+    rtree, isp_builder = create_ip_to_asn_dict()
     dump(rtree, IP_ISP_RTREE_JOBLIB)
+    isp_builder.write(IP_ISP_INDEX)
+
+def convert_ip_to_isp_rtree():
+    """
+    Build the IP to ISP index from the existing radix tree, without downloading
+    """
+    print('* Converting IP to ISP Radix Tree to index.')
+    try:
+        isp_builder = ISPBuilder()
+        for rnode in load(IP_ISP_RTREE_JOBLIB).nodes():
+            isp_builder.add(rnode.prefix, rnode.data.get('isp', 'UNKNOWN'))
+        isp_builder.write(IP_ISP_INDEX)
+        print('* IP to ISP index created with {} prefixes.'.format(len(isp_builder)))
+    except Exception as e:
+        print('* ERROR IN CONVERTING IP TO ISP RADIX TREE : ', e)
+        sys.exit(1)
 
 def create_ip_to_isp_rtree():
     print('* Creating IP to ISP Radix Tree.')
@@ -86,8 +111,15 @@ def create_ip_to_isp_rtree():
         sys.exit(1)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update the IP to ISP database')
+    parser.add_argument('--convert', action='store_true',
+                        help='Only build the IP to ISP index from the existing radix tree')
+    args = parser.parse_args()
     try:
-        create_ip_to_isp_rtree()
+        if args.convert:
+            convert_ip_to_isp_rtree()
+        else:
+            create_ip_to_isp_rtree()
     except Exception as e:
         print('* ERROR IN CREATING RADIX TREE : ', e)
         sys.exit(1)
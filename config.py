@@ -28,16 +28,35 @@ OUTPUT_DIR = os.path.join(DATA_DIR, 'output')
 # Resources folder, where geoip_db, joblib etc exists
 RESOURCES_DIR = os.path.join(DATA_DIR, 'resources')
 
+# Parsed log cache folder. Logs parsed once are reused from here while the
+# log file is unchanged. Least recently used entries are removed once the
+# folder grows beyond LOG_CACHE_MAX_BYTES
+LOG_CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+LOG_CACHE_MAX_BYTES = 5 * 1024 ** 3
+USE_LOG_CACHE = True
+
+# Incremental mode state folder. The windowed counts of the logs analysed
+# so far are kept here, so that each new log only needs its own rows
+STATE_DIR = os.path.join(DATA_DIR, 'state')
+INCREMENTAL = False
+
 # GeoIP database location
 GEOLITE_DB = os.path.join(RESOURCES_DIR, 'GeoLite2-City/GeoLite2-City.mmdb')
 
+# Number of IP addresses whose geo location is kept in memory during a run
+GEOIP_CACHE_SIZE = 65536
+
 # URL FOR FETCHING UPDATED IP-ASN and ASN-ISP DATA AND IP-ISP database location
 IP_ASN_URL = 'http://thyme.apnic.net/current/data-raw-table'
 ASN_ISP_URL = 'http://thyme.apnic.net/current/data-used-autnums'
 IP_ISP_RTREE_JOBLIB = os.path.join(RESOURCES_DIR, 'ip_isp_rtree.joblib')
+# Memory mapped IP to ISP table, used instead of the radix tree when it exists
+IP_ISP_INDEX = os.path.join(RESOURCES_DIR, 'ip_isp.idx')
 
 # Blacklisted IP TRIE Joblib and output file
 BLACKLISTED_IP_TRIE_JOBLIB = os.path.join(RESOURCES_DIR, 'blacklisted_ip_trie.joblib')
+# Memory mapped blacklist index, used instead of the trie when it exists
+BLACKLISTED_IP_INDEX = os.path.join(RESOURCES_DIR, 'blacklisted_ip.idx')
 BLACKLISTED_IP_URL = 'https://myip.ms/files/blacklist/general/full_blacklist_database.zip'
 
 # The Log files should be in a CSV format and must have standard columns
@@ -47,13 +66,90 @@ BLACKLISTED_IP_URL = 'https://myip.ms/files/blacklist/general/full_blacklist_dat
 FIREWALL_LOG_STD_COLS = {'_time', 'host', 'action', 'dest_ip', 'dest_port', 'src_ip'}
 O365_LOG_STD_COLS = {'_time', 'deviceInformation', 'ipAddress', 'user', 'location.country', 'location.city', 'app', 'loginStatus'}
 
+# Column types applied when the logs are read. 'category' dictionary encodes
+# the repetitive strings (IPs, users, hosts, statuses, ...) into integer codes
+# and 'port' stores ports as small unsigned integers. Columns left out keep
+# the type inferred by pandas.
+# IPs stay categorical rather than packed integers (utils.ip_to_int): the
+# classification and blacklist lookups already run once per category, and the
+# GeoIP lookups, the anomaly models and the outputs need the IP strings
+FIREWALL_LOG_DTYPES = {'host': 'category', 'action': 'category', 'dest_ip': 'category',
+                       'dest_port': 'port', 'src_ip': 'category'}
+O365_LOG_DTYPES = {'deviceInformation': 'category', 'ipAddress': 'category', 'user': 'category',
+                   'location.country': 'category', 'location.city': 'category', 'app': 'category',
+                   'loginStatus': 'category'}
+
+# Format of the _time column: a strftime format or one of the presets
+# 'splunk' (2020-01-02T17:22:35.000+0000), 'iso8601', 'epoch_s', 'epoch_ms'.
+# None detects the format from a sample of the log
+TIME_FORMAT = None
+
 # Time window bucket:
 # 's' is for seconds and must always end with 's'
 # eg: 60s, 120s, 3600s, etc...
 WINDOW_SLICE = '60s'
 
+# Number of rows read at a time while streaming the firewall log.
+# Non blocked rows are dropped chunk by chunk, so memory grows with
+# the blocked events only. 0 reads the whole file in one go
+CSV_CHUNK_SIZE = 0
+
+# Follow mode (--follow): an alert is raised as soon as a key reaches the
+# threshold number of events within WINDOW_SLICE. Firewall keys are
+# (src_ip, dest_ip, dest_port) blocked connections, O365 keys are
+# (user, ipAddress) failed logins. The log is polled every
+# FOLLOW_POLL_INTERVAL seconds for new rows
+FIREWALL_ALERT_THRESHOLD = 100
+O365_ALERT_THRESHOLD = 10
+FOLLOW_POLL_INTERVAL = 1.0
+
 # CONFIGURING ISP NAME OF THE ENTERPRISE
 ISP_NAME = 'NETAPP'
+# IPs whose ISP name contains any of these names are not reported as anomalies
+ISP_NAMES = [ISP_NAME]
+
+# Seed of the IsolationForest models, so anomaly outputs are reproducible
+RANDOM_STATE = 8
+
+# Number of worker processes used to fit the anomaly models
+N_JOBS = 1
+
+# Number of analyses run at the same time on threads, eg: the source and the
+# destination IP analyses. They share the parsed log and the intermediate
+# frames (the failed logins, ...). 1 runs the analyses one after the other
+ANALYSIS_THREADS = 4
+
+# Number of shards of the firewall window analyses. Events are split by a
+# hash of their group and every shard is counted on its own process
+FIREWALL_SHARDS = 1
+
+# Anomaly rows buffered in memory before they are spilled to a temporary
+# file. 0 keeps everything in memory
+RESULT_SPILL_ROWS = 1000000
+
+# Analyses run by each analyser, --only runs a subset of them, eg: --only src,dest.
+# Only the resources used by the selected analyses are loaded
+FIREWALL_ANALYSES = ['src', 'dest']
+O365_ANALYSES = ['login_count', 'os', 'ip', 'max_failure']
+ANOMALY_ANALYSES = ['ip_switch', 'ip_outliers', 'login_anomaly']
+# Selected analyses, None runs all of them
+ONLY_ANALYSES = None
+
+# Format of the output files (--output-format): 'csv', 'csv.gz', 'csv.zst'
+# (needs the zstandard package) or 'parquet' (needs pyarrow). Outputs are
+# written OUTPUT_CHUNK_ROWS rows at a time (0 writes them at once), on a
+# background thread unless OUTPUT_BACKGROUND is False
+OUTPUT_FORMAT = 'csv'
+OUTPUT_CHUNK_ROWS = 1000000
+OUTPUT_BACKGROUND = True
+
+# Stage profile (--profile): wall time, CPU time, memory and row counts of
+# every stage, written to OUTPUT_DIR as Profile_<analyser>_<timestamp>.json/.csv.
+# PROFILE_TRACE_MEMORY also measures the memory allocated by every stage
+# (slower). PROFILE_STAGE names a stage to run under cProfile, eg: 'src_ip_analysis'
+PROFILE = False
+PROFILE_TRACE_MEMORY = False
+PROFILE_STAGE = None
 
 if __name__ == '__main__':
     print('*** Cannot execute config file! ***')
@@ -12,11 +12,18 @@ Changelog:
 """
 import sys
 import argparse
-import numpy as np
-import pandas as pd
-import geoip2.database
-from joblib import load
 import datetime
+from functools import lru_cache
+
+try:
+    from lazy_loader import lazy_import, lazy_resource
+except:
+    print('* Lazy loader file not found! Error!')
+    sys.exit(1)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+geoip2_database = lazy_import('geoip2.database')
 
 try:
     from config import *
@@ -31,31 +38,120 @@ except:
     print('* Utils file not found! Error!')
     sys.exit(1)
 
+try:
+    from ip_index import load_blacklist
+except:
+    print('* IP index file not found! Error!')
+    sys.exit(1)
+
+try:
+    from log_cache import ParsedLogCache
+except:
+    print('* Log cache file not found! Error!')
+    sys.exit(1)
+
+try:
+    from window_state import AnalysisState
+except:
+    print('* Window state file not found! Error!')
+    sys.exit(1)
+
+try:
+    from log_follower import follow_csv, windowed_alerts
+except:
+    print('* Log follower file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_executor import StageExecutor
+except:
+    print('* Stage executor file not found! Error!')
+    sys.exit(1)
+
+try:
+    from output_writer import OutputWriter, OUTPUT_FORMATS, check_output_format
+except:
+    print('* Output writer file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_profiler import StageProfiler, profiled_stage
+except:
+    print('* Stage profiler file not found! Error!')
+    sys.exit(1)
+
 
 class FirewallLogAnalyzer:
     """
     Firewall Log Analyser
     """
     def __init__(self):
+        self.cached_geo_location = lru_cache(maxsize=GEOIP_CACHE_SIZE)(self.lookup_geo_location)
+        self.log_cache = ParsedLogCache(LOG_CACHE_DIR, LOG_CACHE_MAX_BYTES)
+        self.state = None
+        self.profiler = None
+        self.writer = OutputWriter(OUTPUT_FORMAT, OUTPUT_CHUNK_ROWS, OUTPUT_BACKGROUND)
+        self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+    @lazy_resource
+    def geo_ip_reader(self):
+        """
+        GeoLite2 reader, opened by the first GeoIP lookup
+        """
         try:
-            self.geo_ip_reader = geoip2.database.Reader(GEOLITE_DB)
-            self.blacklisted_ip = load(BLACKLISTED_IP_TRIE_JOBLIB)
-            self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+            return geoip2_database.Reader(GEOLITE_DB)
         except Exception as e:
             print('* ERROR IN READING GEOIP DATABASE : ', e)
             sys.exit(1)
 
+    @lazy_resource
+    def blacklisted_ip(self):
+        """
+        Blacklisted IP index, loaded by the first blacklist check
+        """
+        try:
+            return load_blacklist(BLACKLISTED_IP_INDEX, BLACKLISTED_IP_TRIE_JOBLIB)
+        except Exception as e:
+            print('* ERROR IN READING BLACKLISTED IP DATABASE : ', e)
+            sys.exit(1)
+
+    def read_csv_chunks(self, file_name, chunk_size):
+        """
+        Stream the log file in chunks of chunk_size rows, keeping only the
+        blocked rows of every chunk. A log without the standard columns is
+        not streamed: its columns are returned for verify_columns to reject.
+        :param file_name:
+        :param chunk_size: rows per chunk
+        :return: DataFrame of the blocked events
+        """
+        header = pd.read_csv(file_name, nrows=0).columns
+        if set(header) != FIREWALL_LOG_STD_COLS:
+            return pd.DataFrame(columns=header)
+        chunks = []
+        for chunk in pd.read_csv(file_name, chunksize=chunk_size):
+            chunks.append(chunk.loc[chunk['action'] == 'blocked', :])
+        if not chunks:
+            # header only log
+            chunks.append(pd.DataFrame(columns=header))
+        return apply_schema(pd.concat(chunks, ignore_index=True), FIREWALL_LOG_DTYPES)
+
+    @profiled_stage
     def read_csv_file(self, file_name):
         try:
             print('* Reading log file...')
-            self.data = pd.read_csv(file_name)
-            self.data = self.data.loc[self.data['action'] == 'blocked', :]
+            if CSV_CHUNK_SIZE:
+                self.data = self.read_csv_chunks(file_name, CSV_CHUNK_SIZE)
+            else:
+                self.data = pd.read_csv(file_name, dtype=read_dtypes(FIREWALL_LOG_DTYPES))
+                self.data = self.data.loc[self.data['action'] == 'blocked', :]
+                self.data = apply_schema(self.data, FIREWALL_LOG_DTYPES)
             self.data['action'] = 1
             return True
         except Exception as e:
             print('* ERROR IN READING CSV FILE : ', e)
             return False
 
+    @profiled_stage
     def verify_columns(self):
         print('* Columns check...')
         columns = self.data.columns.values
@@ -63,10 +159,11 @@ class FirewallLogAnalyzer:
             return True
         return False
 
+    @profiled_stage
     def datetime_index(self):
         try:
-            self.data['_time'] = pd.to_datetime(self.data['_time'])
-            self.data = self.data.sort_values(by='_time')
+            self.data['_time'] = parse_time(self.data['_time'], TIME_FORMAT)
+            self.data = sort_by_column(self.data, '_time')
             self.data.index = self.data['_time']
             self.data = self.data.drop('_time', axis=1)
             return True
@@ -74,114 +171,264 @@ class FirewallLogAnalyzer:
             print('* ERROR IN CONVERTING INDEX TO DATETIME : ', e)
             return False
 
-    def get_geo_location(self, ip):
-        if not is_ip_private(ip):
-            try:
-                response = self.geo_ip_reader.city(ip)
-                country = response.country.name
-                city = response.city.name
-                if country is None:
-                    country = 'NA'
-                if city is None:
-                    city = 'NA'
-                return country, city
-            except Exception as e:
-                print('* ERROR IN CONVERTING IP TO LOCATION : {}'.format(e))
-                return 'NA', 'NA'
-        else:
+    @profiled_stage
+    def load_log(self, file_name):
+        """
+        Read, validate and index the log file by time. The parsed log is cached
+        under LOG_CACHE_DIR and reused while the file is unchanged.
+        :param file_name:
+        :return: True if the log was loaded
+        """
+        cache_key = None
+        if USE_LOG_CACHE:
+            cache_key = self.log_cache.key(file_name, FIREWALL_LOG_STD_COLS, 'firewall', TIME_FORMAT)
+            self.data = self.log_cache.load(cache_key)
+            if self.data is not None:
+                print('* Parsed log loaded from cache...')
+                return True
+        if self.read_csv_file(file_name):
+            if self.verify_columns():
+                if self.datetime_index():
+                    if cache_key is not None:
+                        self.log_cache.store(cache_key, self.data)
+                    return True
+                return False
+            else:
+                print('* Invalid columns found!')
+                print('* Column names must be : ', FIREWALL_LOG_STD_COLS)
+                sys.exit(1)
+        return False
+
+    @profiled_stage
+    def load_logs(self, file_names):
+        """
+        Read, validate and index by time several log files, parsed in
+        parallel on N_JOBS processes, and merge them in time order. Each file
+        is parsed (and cached) on its own, the windows that span two files are
+        counted on the merged log.
+        :param file_names: log file or list of log files
+        :return: True if all the logs were loaded
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        if len(file_names) == 1:
+            return self.load_log(file_names[0])
+        print('* Reading {} log files...'.format(len(file_names)))
+        settings = {'TIME_FORMAT': TIME_FORMAT, 'USE_LOG_CACHE': USE_LOG_CACHE, 'CSV_CHUNK_SIZE': CSV_CHUNK_SIZE}
+        frames = load_log_files(load_log_file, file_names, settings, N_JOBS)
+        if any(frame is None for frame in frames):
+            return False
+        self.data = merge_time_sorted(frames)
+        return True
+
+    def lookup_geo_location(self, ip):
+        try:
+            response = self.geo_ip_reader.city(ip)
+            country = response.country.name
+            city = response.city.name
+            if country is None:
+                country = 'NA'
+            if city is None:
+                city = 'NA'
+            return country, city
+        except Exception as e:
+            print('* ERROR IN CONVERTING IP TO LOCATION : {}'.format(e))
             return 'NA', 'NA'
 
-    def get_country_city(self, location):
-        country = []
-        city = []
-        for row in location.values:
-            country.append(row[0])
-            city.append(row[1])
-        return country, city
+    @profiled_stage
+    def geo_location_columns(self, ips, prefix):
+        """
+        Resolve the country and city of every distinct IP only once.
+        Private IPs are classified in bulk and never looked up, the rest go
+        through an LRU cache shared by all the analyses of a run.
+        :param ips: Series of IP addresses
+        :param prefix: column prefix, 'src' or 'dest'
+        :return: DataFrame with <prefix>_ip, <prefix>_country and <prefix>_city
+        """
+        unique_ips = pd.unique(ips)
+        private = private_ip_mask(unique_ips)
+        location = pd.DataFrame([('NA', 'NA') if is_private else self.cached_geo_location(ip)
+                                 for ip, is_private in zip(unique_ips, private)],
+                                columns=[prefix + '_country', prefix + '_city'])
+        location.insert(0, prefix + '_ip', unique_ips)
+        return location
 
     def check_blacklisted_ip(self, ip):
         return ip in self.blacklisted_ip
 
+    @profiled_stage
+    def windowed_max_count(self, state_name, keys, name):
+        """
+        Windowed max count of the log, or of all the logs analysed so far in
+        incremental mode
+        :param state_name: name the state is stored under
+        :param keys: list of group columns
+        :param name: name of the count column
+        :return: DataFrame with the keys and the max count, sorted by keys
+        """
+        if self.state is not None:
+            return self.state.windowed_max_count(state_name, self.data, keys, WINDOW_SLICE, name)
+        return windowed_max_count(self.data, keys, WINDOW_SLICE, name, FIREWALL_SHARDS)
+
+    @profiled_stage
     def src_ip_analysis(self):
         """
         Use-case:- Analytics based on Source IP. Look for all connections from source-ip perspective
         Includes the count, whether blacklisted or not, country, etc...
-        :return:
+        :return: DataFrame written
         """
-        src_df = self.data.groupby(['src_ip', 'dest_ip', 'dest_port'])\
-                        .rolling(WINDOW_SLICE)\
-                        .agg({'action': 'count'})\
-                        .groupby(['src_ip', 'dest_ip', 'dest_port'])\
-                        .max()\
-                        .reset_index()
-        src_df = src_df.rename(columns={'action': 'traffic_count'})
-        src_df['bl_src_ip'] = src_df['src_ip'].map(lambda x: self.check_blacklisted_ip(x))
-        src_df['bl_dest_ip'] = src_df['dest_ip'].map(lambda x: self.check_blacklisted_ip(x))
-        dest_location = src_df['dest_ip'].map(lambda x: self.get_geo_location(x))
-        dest_country, dest_city = self.get_country_city(dest_location)
-        src_location = src_df['src_ip'].map(lambda x: self.get_geo_location(x))
-        src_country, src_city = self.get_country_city(src_location)
-        src_df['dest_country'] = dest_country
-        src_df['dest_city'] = dest_city
-        src_df['src_country'] = src_country
-        src_df['src_city'] = src_city
+        src_df = self.windowed_max_count('src_ip', ['src_ip', 'dest_ip', 'dest_port'], 'traffic_count')
+        src_df['bl_src_ip'] = self.blacklisted_ip.contains(src_df['src_ip'])
+        src_df['bl_dest_ip'] = self.blacklisted_ip.contains(src_df['dest_ip'])
+        src_df = src_df.merge(self.geo_location_columns(src_df['dest_ip'], 'dest'), on='dest_ip', how='left')
+        src_df = src_df.merge(self.geo_location_columns(src_df['src_ip'], 'src'), on='src_ip', how='left')
         src_df = src_df[['src_country', 'src_city', 'src_ip', 'bl_src_ip',
                          'dest_country', 'dest_city', 'dest_ip', 'bl_dest_ip',
                          'dest_port', 'traffic_count']]
-        src_df.to_csv(os.path.join(OUTPUT_DIR, 'BlockedTrafficForEachSourceIP_' + self.timestamp + '.csv'), index=None)
+        self.writer.write(src_df, os.path.join(OUTPUT_DIR, 'BlockedTrafficForEachSourceIP_' + self.timestamp))
+        return src_df
 
+    @profiled_stage
     def dest_ip_analysis(self):
         """
         Use-case:- Analytics based on Destination IP.
-        :return:
+        :return: DataFrame written
         """
-        dest_df = self.data.groupby(['dest_ip', 'dest_port'])\
-                        .rolling(WINDOW_SLICE)\
-                        .agg({'action': 'count'})\
-                        .groupby(['dest_ip', 'dest_port'])\
-                        .max()\
-                        .reset_index()
-        dest_df = dest_df.rename(columns={'action': 'traffic_count'})
-        dest_df['bl_dest_ip'] = dest_df['dest_ip'].map(lambda x: self.check_blacklisted_ip(x))
-        dest_location = dest_df['dest_ip'].map(lambda x: self.get_geo_location(x))
-        dest_country, dest_city = self.get_country_city(dest_location)
-        dest_df['dest_country'] = dest_country
-        dest_df['dest_city'] = dest_city
+        dest_df = self.windowed_max_count('dest_ip', ['dest_ip', 'dest_port'], 'traffic_count')
+        dest_df['bl_dest_ip'] = self.blacklisted_ip.contains(dest_df['dest_ip'])
+        dest_df = dest_df.merge(self.geo_location_columns(dest_df['dest_ip'], 'dest'), on='dest_ip', how='left')
         dest_df = dest_df[['dest_country', 'dest_city', 'dest_ip', 'bl_dest_ip',
                            'dest_port', 'traffic_count']]
-        dest_df.to_csv(os.path.join(OUTPUT_DIR, 'BlockedTrafficForEachDestinationIP_' + self.timestamp + '.csv'), index=None)
+        self.writer.write(dest_df, os.path.join(OUTPUT_DIR, 'BlockedTrafficForEachDestinationIP_' + self.timestamp))
+        return dest_df
+
+    def follow(self, file_name):
+        """
+        Use-case:- Real-time alerts. Tail the log and alert as soon as a source IP makes
+        FIREWALL_ALERT_THRESHOLD blocked connections to a destination IP & port within the window
+        :param file_name: log file, '-' for stdin
+        :return:
+        """
+        print('* Following {}...'.format(file_name))
+        frames = (rows.loc[rows['action'] == 'blocked', :] for rows in follow_csv(file_name, FOLLOW_POLL_INTERVAL))
+        for time, (src_ip, dest_ip, dest_port) in windowed_alerts(frames, ['src_ip', 'dest_ip', 'dest_port'],
+                                                                  WINDOW_SLICE, FIREWALL_ALERT_THRESHOLD,
+                                                                  TIME_FORMAT):
+            print('* ALERT {} : {} blocked connections within {} from {}{} to {}{}:{}'.format(
+                time, FIREWALL_ALERT_THRESHOLD, WINDOW_SLICE,
+                src_ip, ' (blacklisted)' if self.check_blacklisted_ip(src_ip) else '',
+                dest_ip, ' (blacklisted)' if self.check_blacklisted_ip(dest_ip) else '', dest_port), flush=True)
 
     def perform_analysis(self, file_name):
         """
         Begin analytics for the provided log file.
-        :param file_name:
+        :param file_name: log file or list of log files
         :return:
         """
-        if self.read_csv_file(file_name):
-            if self.verify_columns():
-                if self.datetime_index():
-                    try:
-                        print('* Profiling...')
-                        self.src_ip_analysis()
-                        self.dest_ip_analysis()
-                    except Exception as e:
-                        print('* ERROR IN PERFORMING ANALYSIS : ', e)
-                        sys.exit(1)
-            else:
-                print('* Invalid columns found!')
-                print('* Column names must be : ', FIREWALL_LOG_STD_COLS)
+        if PROFILE:
+            self.profiler = self.writer.profiler = StageProfiler('firewall', OUTPUT_DIR, self.timestamp,
+                                                                 PROFILE_TRACE_MEMORY, PROFILE_STAGE)
+        if self.load_logs(file_name):
+            try:
+                if INCREMENTAL:
+                    self.state = AnalysisState(os.path.join(STATE_DIR, 'firewall.pkl'))
+                    self.state.load()
+                    self.state.check_order(self.data)
+                print('* Profiling...')
+                analyses = FIREWALL_ANALYSES if ONLY_ANALYSES is None else ONLY_ANALYSES
+                executor = StageExecutor()
+                if 'src' in analyses:
+                    executor.add('src', self.src_ip_analysis)
+                if 'dest' in analyses:
+                    executor.add('dest', self.dest_ip_analysis)
+                executor.run(ANALYSIS_THREADS)
+                self.writer.close()
+                if self.state is not None:
+                    self.state.save()
+            except Exception as e:
+                print('* ERROR IN PERFORMING ANALYSIS : ', e)
                 sys.exit(1)
+        if PROFILE:
+            print('* Profile report: {}'.format(', '.join(self.profiler.write_report())))
+
+
+def load_log_file(file_name, settings):
+    """
+    Read, validate and index by time one log file. Kept at module level so
+    it can run in worker processes.
+    :param file_name:
+    :param settings: settings of the parent process, eg: TIME_FORMAT
+    :return: DataFrame, None if the log could not be loaded
+    """
+    globals().update(settings)
+    analyzer = FirewallLogAnalyzer()
+    if analyzer.load_log(file_name):
+        return analyzer.data
+    return None
 
 
 if __name__ == '__main__':
     print('* {}  v{}: Firewall'.format(__prog__, __version__))
     print('* Update the Blacklisted IP database if you haven\'t done so in the last 24hrs!')
     parser = argparse.ArgumentParser(description=__prog__, prog=__prog__)
-    parser.add_argument('filename')
+    parser.add_argument('filename', nargs='+', help='Log files or glob patterns, eg: "logs/*.csv"')
     parser.add_argument('-w', '--window-slice', default=WINDOW_SLICE, help='Time Window bucket in seconds')
+    parser.add_argument('-c', '--chunk-size', default=CSV_CHUNK_SIZE, type=int,
+                        help='Stream the log file in chunks of N rows (0 reads it at once)')
+    parser.add_argument('-j', '--jobs', default=N_JOBS, type=int, help='Number of processes parsing the log files')
+    parser.add_argument('-s', '--shards', default=FIREWALL_SHARDS, type=int,
+                        help='Number of processes counting the windows, events are split by their group')
+    parser.add_argument('-t', '--time-format', default=TIME_FORMAT,
+                        help="Format of _time: strftime format or 'splunk', 'iso8601', 'epoch_s', 'epoch_ms' "
+                             "(default: detected from the log)")
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help="Follow the log as it grows ('-' reads stdin) and print alerts")
+    parser.add_argument('--threshold', default=FIREWALL_ALERT_THRESHOLD, type=int,
+                        help='Blocked connections within the window that raise an alert in follow mode')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Add the log to the counts of the logs analysed before (state in {})'.format(STATE_DIR))
+    parser.add_argument('--threads', default=ANALYSIS_THREADS, type=int,
+                        help='Number of analyses run at the same time')
+    parser.add_argument('--only', help='Comma separated analyses to run, among {} (default: all)'
+                        .format(','.join(FIREWALL_ANALYSES)))
+    parser.add_argument('--output-format', default=OUTPUT_FORMAT, choices=list(OUTPUT_FORMATS),
+                        help='Format of the output files')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the parsed log cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the time, memory and row counts of every stage to OUTPUT_DIR')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also measure the memory allocated by every stage with tracemalloc (slower)')
+    parser.add_argument('--profile-stage', default=PROFILE_STAGE,
+                        help='Stage to run under cProfile, eg: src_ip_analysis (implies --profile)')
     args = parser.parse_args()
+    OUTPUT_FORMAT = args.output_format
+    try:
+        check_output_format(OUTPUT_FORMAT)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    USE_LOG_CACHE = not args.no_cache
+    PROFILE_TRACE_MEMORY = args.profile_memory
+    PROFILE_STAGE = args.profile_stage
+    PROFILE = args.profile or PROFILE_TRACE_MEMORY or PROFILE_STAGE is not None
+    INCREMENTAL = args.incremental
+    TIME_FORMAT = args.time_format
+    N_JOBS = args.jobs
+    ANALYSIS_THREADS = args.threads
+    FIREWALL_SHARDS = args.shards
     WINDOW_SLICE = args.window_slice
     WINDOW_SLICE = check_window_slice(WINDOW_SLICE)
+    CSV_CHUNK_SIZE = args.chunk_size
+    FIREWALL_ALERT_THRESHOLD = args.threshold
+    try:
+        ONLY_ANALYSES = select_analyses(args.only, FIREWALL_ANALYSES)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    if args.only and INCREMENTAL:
+        print('* --only cannot be used with --incremental, the windows of the other analyses would miss the log! '
+              'Exiting...!')
+        sys.exit(1)
 
     if not os.access(RESOURCES_DIR, os.F_OK):
         print("* Error accessing '{}' folder! Exiting...!".format(RESOURCES_DIR))
@@ -190,15 +437,38 @@ if __name__ == '__main__':
     is_dirs(ML_DIR, OUTPUT_DIR)  # check if folders exist, else create them
 
     if args.filename:
-        file_name = args.filename
-        if not os.access(file_name, os.F_OK):
-            print("* Error accessing '{}'! Exiting...!".format(file_name))
+        file_names = expand_file_names(args.filename)
+        if not file_names:
+            print("* No log file matches '{}'! Exiting...!".format(' '.join(args.filename)))
+            sys.exit(1)
+        for name in file_names:
+            if name != '-' and not os.access(name, os.F_OK):
+                print("* Error accessing '{}'! Exiting...!".format(name))
+                sys.exit(1)
+        if args.follow and len(file_names) != 1:
+            print('* Only one log file can be followed! Exiting...!')
             sys.exit(1)
 
         print('* params:')
         print('  --window-slice: {}'.format(WINDOW_SLICE))
+        print('  --chunk-size: {}'.format(CSV_CHUNK_SIZE))
+        print('  --jobs: {}'.format(N_JOBS))
+        print('  --threads: {}'.format(ANALYSIS_THREADS))
+        print('  --shards: {}'.format(FIREWALL_SHARDS))
+        print('  --time-format: {}'.format(TIME_FORMAT))
+        print('  --output-format: {}'.format(OUTPUT_FORMAT))
+        print('  --incremental: {}'.format(INCREMENTAL))
+        print('  --only: {}'.format(','.join(ONLY_ANALYSES)))
+        print('  --profile: {}'.format(PROFILE))
         fa = FirewallLogAnalyzer()
-        fa.perform_analysis(file_name)
+        if args.follow:
+            print('  --threshold: {}'.format(FIREWALL_ALERT_THRESHOLD))
+            try:
+                fa.follow(file_names[0])
+            except KeyboardInterrupt:
+                print('* Stopped following {}'.format(file_names[0]))
+        else:
+            fa.perform_analysis(file_names)
     else:
         print('* Example: ')
         print('* {} /path/to/log_file.csv'.format(__file__))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Synthetic Logs: This file generates deterministic firewall and O365 logs for benchmarks
+Version: 1.1
+Changelog:
+    v1.1        Synthetic firewall and O365 logs
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+try:
+    from config import FIREWALL_LOG_STD_COLS, O365_LOG_STD_COLS, DATA_DIR
+except:
+    print('* Config file not found! Error!')
+    sys.exit(1)
+
+FIREWALL_COLUMNS = ['_time', 'host', 'action', 'dest_ip', 'dest_port', 'src_ip']
+O365_COLUMNS = ['_time', 'deviceInformation', 'ipAddress', 'user', 'location.country', 'location.city', 'app',
+                'loginStatus']
+PORTS = [443, 80, 22, 53, 3389, 445, 25, 8080, 23, 3306, 1433, 5900, 21, 123, 161]
+DEVICES = ['PC;Windows 10;Chrome;x', 'PC;Windows 10;Edge;x', 'Mac;MacOS;Safari;y', 'Mac;MacOS;Chrome;y',
+           'Mobile;iOS;Safari;z', 'Mobile;Android;Chrome;z', 'PC;Linux;Firefox;x']
+LOCATIONS = [('US', 'New York'), ('US', 'San Jose'), ('IN', 'Bangalore'), ('GB', 'London'), ('DE', 'Berlin'),
+             ('SG', 'Singapore'), ('BR', 'Sao Paulo'), ('AU', 'Sydney')]
+APPS = ['Outlook', 'SharePoint', 'Teams', 'OneDrive', 'Azure Portal']
+START_TIME = '2020-01-01'
+WRITE_CHUNK_ROWS = 1000000
+PRIVATE_IP_SHARE = 0.3
+
+assert set(FIREWALL_COLUMNS) == FIREWALL_LOG_STD_COLS
+assert set(O365_COLUMNS) == O365_LOG_STD_COLS
+
+
+def skewed_choice(rng, n, size, skew):
+    """
+    Draw indexes in [0, n) following a Zipf like law: index i has a weight
+    of 1 / (i + 1) ** skew. skew 0 draws uniformly, larger skews concentrate
+    the draws on the first indexes.
+    :param rng: numpy Generator
+    :param n: number of values
+    :param size: number of draws
+    :param skew:
+    :return: int array
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+
+def ip_pool(rng, n):
+    """
+    :param rng: numpy Generator
+    :param n: number of distinct IPs
+    :return: array of IPv4 addresses, PRIVATE_IP_SHARE of them in 10.0.0.0/8
+    """
+    ips = rng.choice(1 << 24, size=n, replace=False)
+    first = np.where(rng.random(n) < PRIVATE_IP_SHARE, 10, rng.integers(11, 224, n))
+    first = np.where(first == 127, 128, first)
+    octets = [first, (ips >> 16) & 255, (ips >> 8) & 255, ips & 255]
+    return pd.Series(octets[0].astype(str)).str.cat([pd.Series(o.astype(str)) for o in octets[1:]], sep='.').values
+
+
+def time_strings(rng, size, days):
+    """
+    :param rng: numpy Generator
+    :param size: number of timestamps
+    :param days: time span in days
+    :return: Splunk like timestamps, eg: 2020-01-02T17:22:35.000+0000, in random order
+    """
+    seconds = rng.integers(0, int(days * 86400), size)
+    times = np.datetime64(START_TIME, 's') + seconds.astype('timedelta64[s]')
+    return np.char.add(np.datetime_as_string(times, unit='s'), '.000+0000')
+
+
+def firewall_chunk(rng, size, ips, hosts, days, skew, blocked_share):
+    """
+    :return: DataFrame of size firewall events
+    """
+    return pd.DataFrame({
+        '_time': time_strings(rng, size, days),
+        'host': np.char.add('fw', (rng.integers(0, hosts, size) + 1).astype(str)),
+        'action': np.where(rng.random(size) < blocked_share, 'blocked', 'allowed'),
+        'dest_ip': ips[skewed_choice(rng, len(ips), size, skew)],
+        'dest_port': np.asarray(PORTS)[skewed_choice(rng, len(PORTS), size, skew)],
+        'src_ip': ips[skewed_choice(rng, len(ips), size, skew)],
+    }, columns=FIREWALL_COLUMNS)
+
+
+def o365_chunk(rng, size, ips, users, user_ips, days, skew, failure_share):
+    """
+    :return: DataFrame of size O365 logins
+    """
+    user = skewed_choice(rng, users, size, skew)
+    # most logins come from one of the few usual IPs of the user
+    usual = (user * 7919 + rng.integers(0, user_ips, size)) % len(ips)
+    other = rng.integers(0, len(ips), size)
+    ip = np.where(rng.random(size) < 0.9, usual, other)
+    location = (user + (ip != usual)) % len(LOCATIONS)
+    return pd.DataFrame({
+        '_time': time_strings(rng, size, days),
+        'deviceInformation': np.asarray(DEVICES)[(user + rng.integers(0, 2, size)) % len(DEVICES)],
+        'ipAddress': ips[ip],
+        'user': np.char.add(np.char.add('user', user.astype(str)), '@example.com'),
+        'location.country': np.asarray([loc[0] for loc in LOCATIONS])[location],
+        'location.city': np.asarray([loc[1] for loc in LOCATIONS])[location],
+        'app': np.asarray(APPS)[skewed_choice(rng, len(APPS), size, skew)],
+        'loginStatus': np.where(rng.random(size) < failure_share, 'Failure', 'Success'),
+    }, columns=O365_COLUMNS)
+
+
+def generate_firewall_log(file_name, rows, ips=10000, hosts=4, days=1, skew=1.0, blocked_share=0.5, seed=0):
+    """
+    Write a synthetic firewall log. The same arguments always give the same file.
+    :param file_name: csv file to write
+    :param rows: number of events
+    :param ips: number of distinct IPs
+    :param hosts: number of firewalls
+    :param days: time span in days
+    :param skew: skew of the IPs and ports, 0 is uniform
+    :param blocked_share: share of blocked events
+    :param seed:
+    :return: file_name
+    """
+    rng = np.random.default_rng(seed)
+    pool = ip_pool(rng, ips)
+    for start in range(0, max(rows, 1), WRITE_CHUNK_ROWS):
+        size = min(WRITE_CHUNK_ROWS, rows - start)
+        firewall_chunk(rng, size, pool, hosts, days, skew, blocked_share)\
+            .to_csv(file_name, mode='w' if start == 0 else 'a', header=start == 0, index=None)
+    return file_name
+
+
+def generate_o365_log(file_name, rows, users=1000, ips=10000, user_ips=3, days=1, skew=1.0, failure_share=0.2,
+                      seed=0):
+    """
+    Write a synthetic O365 log. The same arguments always give the same file.
+    :param file_name: csv file to write
+    :param rows: number of logins
+    :param users: number of distinct users
+    :param ips: number of distinct IPs
+    :param user_ips: number of usual IPs of a user
+    :param days: time span in days
+    :param skew: skew of the users and apps, 0 is uniform
+    :param failure_share: share of failed logins
+    :param seed:
+    :return: file_name
+    """
+    rng = np.random.default_rng(seed)
+    pool = ip_pool(rng, ips)
+    for start in range(0, max(rows, 1), WRITE_CHUNK_ROWS):
+        size = min(WRITE_CHUNK_ROWS, rows - start)
+        o365_chunk(rng, size, pool, users, user_ips, days, skew, failure_share)\
+            .to_csv(file_name, mode='w' if start == 0 else 'a', header=start == 0, index=None)
+    return file_name
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic firewall and O365 logs')
+    parser.add_argument('kind', choices=['firewall', 'o365', 'all'])
+    parser.add_argument('-r', '--rows', default=100000, type=int, help='Number of rows of each log')
+    parser.add_argument('-u', '--users', default=1000, type=int, help='Number of distinct users (O365)')
+    parser.add_argument('--ips', default=10000, type=int, help='Number of distinct IPs')
+    parser.add_argument('--days', default=1, type=float, help='Time span of the logs in days')
+    parser.add_argument('--skew', default=1.0, type=float,
+                        help='Zipf exponent of the users, IPs and ports (0 is uniform)')
+    parser.add_argument('--seed', default=0, type=int, help='Random seed, the same seed gives the same logs')
+    parser.add_argument('-o', '--output-dir', default=os.path.join(DATA_DIR, 'synthetic'))
+    args = parser.parse_args()
+
+    if not os.access(args.output_dir, os.F_OK):
+        os.makedirs(args.output_dir)
+    if args.kind in ('firewall', 'all'):
+        file_name = os.path.join(args.output_dir, 'firewall_{}.csv'.format(args.rows))
+        generate_firewall_log(file_name, args.rows, ips=args.ips, days=args.days, skew=args.skew, seed=args.seed)
+        print('* Firewall log: {}'.format(file_name))
+    if args.kind in ('o365', 'all'):
+        file_name = os.path.join(args.output_dir, 'o365_{}.csv'.format(args.rows))
+        generate_o365_log(file_name, args.rows, users=args.users, ips=args.ips, days=args.days, skew=args.skew,
+                          seed=args.seed)
+        print('* O365 log: {}'.format(file_name))
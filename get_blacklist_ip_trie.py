@@ -13,67 +13,149 @@ Changelog:
 import os
 import time
 import sys
+import argparse
 import io
+import tempfile
 import requests
 import zipfile
 import pygtrie as trie
-from joblib import dump
+from joblib import dump, load
+
 try:
-    import re2 as re
+    from config import BLACKLISTED_IP_URL, BLACKLISTED_IP_TRIE_JOBLIB, BLACKLISTED_IP_INDEX
 except:
-    import re
+    print('* Config file not found! Error!')
+    sys.exit(1)
 
 try:
-    from config import BLACKLISTED_IP_URL, BLACKLISTED_IP_TRIE_JOBLIB
+    from ip_index import BlacklistBuilder
 except:
-    print('* Config file not found! Error!')
+    print('* IP index file not found! Error!')
     sys.exit(1)
 
-IP_PATTERN = r'((((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5]))([^0-9]|$))|(((([0-9A-Fa-f]{1,4}:){7}([0-9A-Fa-f]{1,4}|:))|(([0-9A-Fa-f]{1,4}:){6}(:[0-9A-Fa-f]{1,4}|((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3})|:))|(([0-9A-Fa-f]{1,4}:){5}(((:[0-9A-Fa-f]{1,4}){1,2})|:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3})|:))|(([0-9A-Fa-f]{1,4}:){4}(((:[0-9A-Fa-f]{1,4}){1,3})|((:[0-9A-Fa-f]{1,4})?:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}))|:))|(([0-9A-Fa-f]{1,4}:){3}(((:[0-9A-Fa-f]{1,4}){1,4})|((:[0-9A-Fa-f]{1,4}){0,2}:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}))|:))|(([0-9A-Fa-f]{1,4}:){2}(((:[0-9A-Fa-f]{1,4}){1,5})|((:[0-9A-Fa-f]{1,4}){0,3}:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}))|:))|(([0-9A-Fa-f]{1,4}:){1}(((:[0-9A-Fa-f]{1,4}){1,6})|((:[0-9A-Fa-f]{1,4}){0,4}:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}))|:))|(:(((:[0-9A-Fa-f]{1,4}){1,7})|((:[0-9A-Fa-f]{1,4}){0,5}:((25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(\.(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}))|:)))(%.+)?))'
+# Characters of an IPv4 / IPv6 address or CIDR range, eg: 1.2.3.4, 1.2.3.0/24, ::ffff:1.2.3.4
+IPV4_CHARS = frozenset('0123456789./')
+IPV6_CHARS = frozenset('0123456789abcdefABCDEF:./')
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+
 
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
 
-def download_zipfile():
+def download_file(url):
+    """
+    Download the feed to a temporary file, a chunk at a time
+    :param url: BLACKLISTED_IP_URL
+    :return: path of the temporary file, None if the download failed
+    """
+    f = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
     try:
-        r = requests.get(BLACKLISTED_IP_URL, stream=True)
-        z = zipfile.ZipFile(io.BytesIO(r.content))
-        return z
+        with f, requests.get(url, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                f.write(chunk)
+        return f.name
     except Exception as e:
-        print('* ERROR IN DOWNLOADING AND READING ZIPFILE : ', e)
+        print('* ERROR IN DOWNLOADING FILE : ', e)
+        os.remove(f.name)
         return None
 
-def create_blacklist_ip_trie():
+def read_lines(path):
+    """
+    Lines of the feed, read one at a time
+    :param path: zip file (its first member is read) or text file
+    :return: generator of lines
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as z:
+            with io.TextIOWrapper(z.open(z.filelist[0].filename), encoding='utf-8', errors='replace') as f:
+                yield from f
+    else:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            yield from f
+
+def blacklist_entry(line):
+    """
+    :param line: feed line, eg: '1.2.3.4\t\t\t# 2020-01-01, host, country, ...'
+    :return: the tab delimited first field if it looks like an IP address or CIDR range, None otherwise
+        (comments, headers, blank lines). The index builder validates the address itself.
+    """
+    entry = line.split('\t', 1)[0].strip()
+    if ':' in entry:
+        return entry if IPV6_CHARS.issuperset(entry) else None
+    if entry.count('.') == 3:
+        return entry if IPV4_CHARS.issuperset(entry) else None
+    return None
+
+def add_to_index(builder, ip):
+    """
+    :return: True if the entry was added, False if it is not a valid IP address / CIDR range
+    """
+    try:
+        builder.add(ip)
+        return True
+    except ValueError:
+        print('* Skipping invalid blacklist entry : ', ip)
+        return False
+
+def convert_blacklist_ip_trie():
+    """
+    Build the blacklist index from the existing joblib trie, without downloading
+    """
+    print('* Converting Blacklist IP Trie to index.')
+    try:
+        blacklist_builder = BlacklistBuilder()
+        for ip in load(BLACKLISTED_IP_TRIE_JOBLIB).keys():
+            add_to_index(blacklist_builder, ip)
+        blacklist_builder.write(BLACKLISTED_IP_INDEX)
+        print('* Blacklist IP index created with {} entries.'.format(len(blacklist_builder)))
+    except Exception as e:
+        print('* ERROR IN CONVERTING BLACKLIST IP TRIE : ', e)
+        sys.exit(1)
+
+def create_blacklist_ip_trie(source=BLACKLISTED_IP_URL):
+    """
+    :param source: url of the blacklist feed, or local zip / text file
+    """
     print('* Creating Blacklist IP Trie.')
     try:
         print('* Last update: {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(BLACKLISTED_IP_TRIE_JOBLIB)))))
     except:
         pass
-    blip = None
     blacklisted_ip_trie = trie.CharTrie()
-    z = download_zipfile()
-    if(z != None):
-        try:
-            with z.open(z.filelist[0].filename) as myfile:
-                blip = myfile.read()
-            blip = blip.decode()
-            blip = blip.split('\n')
-            for row in blip:
-                re_obj = re.search(IP_PATTERN, row)
-                if re_obj is not None:
-                    matched_ip = row[re_obj.span()[0]:re_obj.span()[1]].split('\t')[0]
-                    blacklisted_ip_trie[matched_ip] = True
-            dump(blacklisted_ip_trie, BLACKLISTED_IP_TRIE_JOBLIB)
-            print('* Blacklist IP Trie created.')
-        except Exception as e:
-            print('* ERROR IN CREATING BLACKLIST IP TRIE : ', e)
-            sys.exit(1)
-    else:
+    blacklist_builder = BlacklistBuilder()
+    path = download_file(source) if is_url(source) else source
+    if path is None:
         print('* UNABLE TO UPDATE Blacklist IP Trie!!')
         sys.exit(1)
+    try:
+        for line in read_lines(path):
+            ip = blacklist_entry(line)
+            if ip is not None and add_to_index(blacklist_builder, ip):
+                blacklisted_ip_trie[ip] = True
+        dump(blacklisted_ip_trie, BLACKLISTED_IP_TRIE_JOBLIB)
+        blacklist_builder.write(BLACKLISTED_IP_INDEX)
+        print('* Blacklist IP Trie created with {} entries.'.format(len(blacklist_builder)))
+    except Exception as e:
+        print('* ERROR IN CREATING BLACKLIST IP TRIE : ', e)
+        sys.exit(1)
+    finally:
+        if path != source:
+            os.remove(path)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Update the blacklisted IP database')
+    parser.add_argument('--convert', action='store_true',
+                        help='Only build the blacklist index from the existing joblib trie')
+    parser.add_argument('--source', default=BLACKLISTED_IP_URL,
+                        help='Url of the blacklist feed, or local zip / text file (default: {})'.format(BLACKLISTED_IP_URL))
+    args = parser.parse_args()
     try:
-        create_blacklist_ip_trie()
+        if args.convert:
+            convert_blacklist_ip_trie()
+        else:
+            create_blacklist_ip_trie(args.source)
     except Exception as e:
         print('* ERROR IN CREATING TRIE : ', e)
         sys.exit(1)
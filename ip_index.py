@@ -0,0 +1,350 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+IP Index: This file has the memory mapped IP range tables used for the blacklist and ISP lookups
+Version: 1.1
+Changelog:
+    v1.1        Sorted IP range table, replaces the pickled blacklist trie
+                and the IP to ISP radix tree
+"""
+import os
+import struct
+import ipaddress
+
+from lazy_loader import lazy_import
+from utils import ip_to_int
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+joblib = lazy_import('joblib')
+
+# File layout (little endian):
+#   magic, header (ipv4 ranges, ipv6 ranges, strings, string blob size)
+#   v4_start uint32[], v4_end uint32[], v4_value int32[],
+#   v6_start S16[], v6_end S16[], v6_value int32[],
+#   string_offsets uint64[], string_blob uint8[]
+# Every section starts on a 16 byte boundary. IPv6 addresses are stored as
+# 16 byte big endian strings so that they sort and searchsorted correctly.
+IP_INDEX_MAGIC = b'LAIPIDX1'
+IP_INDEX_HEADER = struct.Struct('<8sQQQQ')
+IP_INDEX_ALIGN = 16
+
+
+def ip_index_sections(n_v4, n_v6, n_strings, blob_size):
+    """
+    Offsets of every section of an IP index file
+    :return: list of (name, dtype, count, offset)
+    """
+    sections = [('v4_start', np.dtype('<u4'), n_v4), ('v4_end', np.dtype('<u4'), n_v4),
+                ('v4_value', np.dtype('<i4'), n_v4), ('v6_start', np.dtype('S16'), n_v6),
+                ('v6_end', np.dtype('S16'), n_v6), ('v6_value', np.dtype('<i4'), n_v6),
+                ('string_offsets', np.dtype('<u8'), n_strings + 1), ('string_blob', np.dtype('u1'), blob_size)]
+    layout = []
+    offset = IP_INDEX_HEADER.size
+    for name, dtype, count in sections:
+        offset += -offset % IP_INDEX_ALIGN
+        layout.append((name, dtype, count, offset))
+        offset += dtype.itemsize * count
+    return layout
+
+
+def v6_keys(high, low):
+    """
+    Pack the high and low halves of IPv6 addresses into sortable 16 byte keys
+    :param high: uint64 array
+    :param low: uint64 array
+    :return: S16 array
+    """
+    keys = np.empty((len(high), 2), dtype='>u8')
+    keys[:, 0] = high
+    keys[:, 1] = low
+    return keys.view('S16').reshape(-1)
+
+
+def write_ip_index(path, v4_ranges, v6_ranges, strings=()):
+    """
+    Write sorted, non overlapping IP ranges to an IP index file.
+    :param path:
+    :param v4_ranges: list of (start, end, value) with integer IPv4 addresses
+    :param v6_ranges: list of (start, end, value) with integer IPv6 addresses
+    :param strings: optional string table referenced by the values
+    :return: None
+    """
+    blob = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(blob) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(b) for b in blob])
+    v4 = np.array(v4_ranges, dtype=np.int64).reshape(-1, 3)
+    v6_start = [(start >> 64, start & ((1 << 64) - 1)) for start, _, _ in v6_ranges]
+    v6_end = [(end >> 64, end & ((1 << 64) - 1)) for _, end, _ in v6_ranges]
+    v6_start = np.array(v6_start, dtype=np.uint64).reshape(-1, 2)
+    v6_end = np.array(v6_end, dtype=np.uint64).reshape(-1, 2)
+    data = {'v4_start': v4[:, 0], 'v4_end': v4[:, 1], 'v4_value': v4[:, 2],
+            'v6_start': v6_keys(v6_start[:, 0], v6_start[:, 1]),
+            'v6_end': v6_keys(v6_end[:, 0], v6_end[:, 1]),
+            'v6_value': [value for _, _, value in v6_ranges],
+            'string_offsets': offsets, 'string_blob': np.frombuffer(b''.join(blob), dtype='u1')}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(IP_INDEX_HEADER.pack(IP_INDEX_MAGIC, len(v4), len(v6_ranges), len(blob), int(offsets[-1])))
+        for name, dtype, count, offset in ip_index_sections(len(v4), len(v6_ranges), len(blob), int(offsets[-1])):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(np.asarray(data[name], dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+
+
+def merge_ranges(ranges):
+    """
+    Merge overlapping and adjacent (start, end) ranges
+    :param ranges: list of (start, end)
+    :return: sorted list of disjoint (start, end)
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def flatten_prefixes(prefixes):
+    """
+    Turn nested prefixes into disjoint ranges, each one carrying the value of
+    the longest (most specific) prefix that covers it. A longest prefix match
+    then becomes a plain range search.
+    :param prefixes: list of (start, end, value); prefixes nest or are disjoint
+    :return: sorted list of disjoint (start, end, value)
+    """
+    ranges = []
+    stack = []
+    cursor = 0
+
+    def close(until):
+        nonlocal cursor
+        while stack and stack[-1][0] < until:
+            end, value = stack.pop()
+            if cursor <= end:
+                ranges.append((cursor, end, value))
+                cursor = end + 1
+
+    for start, end, value in sorted(prefixes, key=lambda p: (p[0], -p[1])):
+        close(start)
+        if stack and cursor < start:
+            ranges.append((cursor, start - 1, stack[-1][1]))
+        stack.append((end, value))
+        cursor = start
+    close(float('inf'))
+    return ranges
+
+
+class IPIndex:
+    """
+    Memory mapped table of sorted, non overlapping IP ranges.
+    Loading only maps the file; lookups for a whole column of IPs are
+    done with searchsorted.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, n_v4, n_v6, n_strings, blob_size = IP_INDEX_HEADER.unpack(f.read(IP_INDEX_HEADER.size))
+        if magic != IP_INDEX_MAGIC:
+            raise ValueError('{} is not an IP index file'.format(path))
+        for name, dtype, count, offset in ip_index_sections(n_v4, n_v6, n_strings, blob_size):
+            if count:
+                section = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+            else:
+                section = np.zeros(0, dtype=dtype)
+            setattr(self, name, section)
+        self.n_v4 = n_v4
+
+    def find(self, ips):
+        """
+        Position of the range holding each IP address
+        :param ips: array/Series of IP address strings
+        :return: int64 array, -1 where no range holds the IP
+        """
+        if isinstance(getattr(ips, 'dtype', None), pd.CategoricalDtype):
+            # dictionary encoded column: search the distinct IPs only
+            return np.append(self.find(ips.cat.categories), -1)[ips.cat.codes.values]
+        version, v4, v6_high, v6_low = ip_to_int(ips)
+        position = np.full(version.shape[0], -1, dtype=np.int64)
+        is_v4 = version == 4
+        if is_v4.any() and self.v4_start.size:
+            found = self.search(self.v4_start, self.v4_end, v4[is_v4])
+            position[is_v4] = found
+        is_v6 = version == 6
+        if is_v6.any() and self.v6_start.size:
+            found = self.search(self.v6_start, self.v6_end, v6_keys(v6_high[is_v6], v6_low[is_v6]))
+            position[is_v6] = np.where(found >= 0, found + self.n_v4, -1)
+        return position
+
+    @staticmethod
+    def search(starts, ends, keys):
+        position = np.searchsorted(starts, keys, side='right') - 1
+        found = position >= 0
+        found[found] = keys[found] <= ends[position[found]]
+        return np.where(found, position, -1)
+
+    def values(self, position):
+        """
+        Value of the ranges at the given positions, -1 where position is -1
+        """
+        position = np.asarray(position)
+        value = np.full(position.shape[0], -1, dtype=np.int64)
+        is_v4 = (position >= 0) & (position < self.n_v4)
+        is_v6 = position >= self.n_v4
+        value[is_v4] = self.v4_value[position[is_v4]]
+        value[is_v6] = self.v6_value[position[is_v6] - self.n_v4]
+        return value
+
+    def string(self, i):
+        return bytes(self.string_blob[self.string_offsets[i]:self.string_offsets[i + 1]]).decode('utf-8')
+
+
+class BlacklistIndex(IPIndex):
+    """
+    Blacklisted IP addresses and CIDR ranges
+    """
+    def contains(self, ips):
+        """
+        Vectorized membership test
+        :param ips: array/Series of IP address strings
+        :return: boolean array, True for blacklisted IPs
+        """
+        return self.find(ips) >= 0
+
+    def __contains__(self, ip):
+        return bool(self.contains([ip])[0])
+
+
+class BlacklistBuilder:
+    """
+    Collects blacklisted IPs / CIDR ranges and writes a BlacklistIndex file
+    """
+    def __init__(self):
+        self.v4_ranges = []
+        self.v6_ranges = []
+
+    def add(self, entry):
+        """
+        Add an IP address or a CIDR range
+        :param entry: eg: '1.2.3.4', '1.2.3.0/24', '2001:db8::/32'
+        :return: None
+        """
+        network = ipaddress.ip_network(entry.strip(), strict=False)
+        ranges = self.v4_ranges if network.version == 4 else self.v6_ranges
+        ranges.append((int(network.network_address), int(network.broadcast_address)))
+
+    def __len__(self):
+        return len(self.v4_ranges) + len(self.v6_ranges)
+
+    def write(self, path):
+        write_ip_index(path,
+                       [(start, end, 0) for start, end in merge_ranges(self.v4_ranges)],
+                       [(start, end, 0) for start, end in merge_ranges(self.v6_ranges)])
+
+
+class TrieBlacklist:
+    """
+    Same interface as BlacklistIndex over the joblib pickled blacklist trie
+    """
+    def __init__(self, path):
+        self.trie = joblib.load(path)
+
+    def contains(self, ips):
+        ips = pd.Series(np.asarray(ips, dtype=object))
+        unique_ips = pd.unique(ips)
+        found = pd.Series([ip in self.trie for ip in unique_ips], index=unique_ips, dtype=bool)
+        return ips.map(found).values.astype(bool)
+
+    def __contains__(self, ip):
+        return ip in self.trie
+
+
+class ISPIndex(IPIndex):
+    """
+    Longest prefix match from IP address to ISP name, with the ISP names
+    interned in the string table of the file
+    """
+    def isp_ids(self, ips):
+        """
+        :param ips: array/Series of IP address strings
+        :return: int64 array of ISP ids, -1 where no prefix matches
+        """
+        return self.values(self.find(ips))
+
+    def lookup(self, ips):
+        """
+        :param ips: array/Series of IP address strings
+        :return: object array of ISP names, None where no prefix matches
+        """
+        ids = self.isp_ids(ips)
+        unique_ids, codes = np.unique(ids, return_inverse=True)
+        names = np.array([self.string(i) if i >= 0 else None for i in unique_ids], dtype=object)
+        return names[codes.reshape(-1)]
+
+
+class ISPBuilder:
+    """
+    Collects (prefix, ISP name) pairs and writes an ISPIndex file
+    """
+    def __init__(self):
+        self.v4_prefixes = []
+        self.v6_prefixes = []
+        self.isp_ids = {}
+
+    def add(self, prefix, isp):
+        """
+        :param prefix: eg: '1.0.0.0/24'
+        :param isp: ISP name
+        :return: None
+        """
+        network = ipaddress.ip_network(prefix.strip(), strict=False)
+        isp_id = self.isp_ids.setdefault(isp, len(self.isp_ids))
+        prefixes = self.v4_prefixes if network.version == 4 else self.v6_prefixes
+        prefixes.append((int(network.network_address), int(network.broadcast_address), isp_id))
+
+    def __len__(self):
+        return len(self.v4_prefixes) + len(self.v6_prefixes)
+
+    def write(self, path):
+        write_ip_index(path, flatten_prefixes(self.v4_prefixes), flatten_prefixes(self.v6_prefixes),
+                       strings=list(self.isp_ids))
+
+
+class RadixISP:
+    """
+    Same interface as ISPIndex over the joblib pickled py-radix tree
+    """
+    def __init__(self, path):
+        self.rtree = joblib.load(path)
+
+    def lookup(self, ips):
+        names = {}
+        for ip in pd.unique(np.asarray(ips, dtype=object)):
+            node = self.rtree.search_best(ip)
+            names[ip] = node.data['isp'] if node is not None else None
+        return np.array([names[ip] for ip in ips], dtype=object)
+
+
+def load_isp_index(index_path, joblib_path):
+    """
+    Load the IP to ISP table, preferring the memory mapped index over the radix tree
+    :param index_path: IP_ISP_INDEX
+    :param joblib_path: IP_ISP_RTREE_JOBLIB
+    :return: ISPIndex or RadixISP
+    """
+    if os.access(index_path, os.F_OK):
+        return ISPIndex(index_path)
+    return RadixISP(joblib_path)
+
+
+def load_blacklist(index_path, joblib_path):
+    """
+    Load the blacklist, preferring the memory mapped index over the joblib trie
+    :param index_path: BLACKLISTED_IP_INDEX
+    :param joblib_path: BLACKLISTED_IP_TRIE_JOBLIB
+    :return: BlacklistIndex or TrieBlacklist
+    """
+    if os.access(index_path, os.F_OK):
+        return BlacklistIndex(index_path)
+    return TrieBlacklist(joblib_path)
@@ -0,0 +1,62 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Lazy Loader: This file defers the import of heavy modules and the loading of resources until they are used
+Version: 1.1
+Changelog:
+    v1.1        Lazy modules and resources
+"""
+import sys
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stand-in for a module, imported on the first attribute access, eg:
+    pd = lazy_import('pandas') costs nothing until pd.read_csv is used.
+    Once imported, the module namespace is copied on the stand-in so the
+    later attribute reads do not go through __getattr__.
+    """
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__dict__['_lazy_name'])
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self.__dict__['_lazy_name'])
+
+
+def lazy_import(name):
+    """
+    :param name: module name, eg: 'pandas', 'sklearn.ensemble'
+    :return: the module if it is already imported, a LazyModule otherwise
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+class lazy_resource:
+    """
+    Method decorator: the method loads a resource on the first access of
+    the attribute of the same name, eg: a database reader, and the resource
+    is kept on the instance (functools.cached_property needs python 3.8).
+    Stages running concurrently load it only once.
+    Assigning the attribute replaces the resource without loading it.
+    """
+    def __init__(self, load):
+        self.load = load
+        self.name = load.__name__
+        self.__doc__ = load.__doc__
+        self.lock = threading.RLock()
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.load(instance)
+        return instance.__dict__[self.name]
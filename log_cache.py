@@ -0,0 +1,124 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Log Cache: This file caches the parsed, validated and time sorted logs in a columnar format
+Version: 1.1
+Changelog:
+    v1.1        Parsed log cache keyed by the input fingerprint
+"""
+import os
+import hashlib
+import importlib.util
+
+from lazy_loader import lazy_import
+
+pd = lazy_import('pandas')
+# pyarrow is only looked up here, pandas imports it when a cache entry is read or written
+CACHE_FORMAT = 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'pkl'
+
+# Bump when the parsing changes, so that older cache entries are not used
+CACHE_VERSION = 2
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_fingerprint(file_name):
+    """
+    Size, modification time and content hash of a file
+    :param file_name:
+    :return: fingerprint string
+    """
+    stat = os.stat(file_name)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            content_hash.update(block)
+    return '{}:{}:{}'.format(stat.st_size, stat.st_mtime_ns, content_hash.hexdigest())
+
+
+class ParsedLogCache:
+    """
+    Parsed logs stored under cache_dir, one file per input fingerprint and
+    schema. Least recently used entries are evicted once the cache grows
+    beyond max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, file_name, std_cols, tag, time_format=None):
+        """
+        :param file_name: log file
+        :param std_cols: FIREWALL_LOG_STD_COLS / O365_LOG_STD_COLS
+        :param tag: name of the parsing stage, eg: 'firewall'
+        :param time_format: TIME_FORMAT the _time column is parsed with
+        :return: cache key
+        """
+        key = '{}|{}|{}|{}|{}'.format(CACHE_VERSION, tag, sorted(std_cols), time_format,
+                                      file_fingerprint(file_name))
+        return '{}_{}'.format(tag, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, '{}.{}'.format(key, CACHE_FORMAT))
+
+    def load(self, key):
+        """
+        :param key:
+        :return: cached DataFrame, None on a cache miss
+        """
+        path = self.path(key)
+        if not os.access(path, os.F_OK):
+            return None
+        try:
+            if CACHE_FORMAT == 'parquet':
+                data = pd.read_parquet(path)
+            else:
+                data = pd.read_pickle(path)
+            os.utime(path)  # mark as recently used
+            return data
+        except Exception as e:
+            print('* ERROR IN READING CACHED LOG : ', e)
+            return None
+
+    def store(self, key, data):
+        path = self.path(key)
+        # one temporary file per process: worker processes may cache the same log
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if CACHE_FORMAT == 'parquet':
+                data.to_parquet(tmp_path)
+            else:
+                data.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+            self.evict()
+        except Exception as e:
+            print('* ERROR IN CACHING PARSED LOG : ', e)
+            if os.access(tmp_path, os.F_OK):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes.
+        The .tmp files other processes are still writing are left alone, and
+        entries removed meanwhile by another process are skipped.
+        :return: None
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,198 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Log Follower: This file tails a growing csv log (or stdin) and raises alerts on windowed counts
+Version: 1.1
+Changelog:
+    v1.1        Follow mode with threshold alerts
+"""
+import io
+import os
+import sys
+import csv
+import time
+import codecs
+from collections import deque, OrderedDict
+
+from lazy_loader import lazy_import
+from utils import resolve_time_format, detect_time_format, parse_time
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+READ_SIZE = 1 << 16
+
+
+def split_lines(text):
+    """
+    :param text: text read so far
+    :return: (complete non empty lines, incomplete last line)
+    """
+    lines = text.split('\n')
+    return [line for line in lines[:-1] if line.strip()], lines[-1]
+
+
+def follow_stdin():
+    """
+    Yield the rows read from stdin as DataFrames, as they arrive, until
+    stdin is closed. The first line is the header.
+    :return: generator of DataFrames with string columns
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    header = None
+    partial = ''
+    while True:
+        data = os.read(sys.stdin.fileno(), READ_SIZE)
+        lines, partial = split_lines(partial + decoder.decode(data, final=not data))
+        if not data and partial.strip():
+            lines.append(partial)
+        if header is None and lines:
+            header = next(csv.reader([lines.pop(0)]))
+        if lines:
+            yield rows_frame(lines, header)
+        if not data:
+            return
+
+
+def follow_csv(file_name, poll_interval):
+    """
+    Yield the rows appended to a csv log as DataFrames, like 'tail -f'.
+    The header is read from the start of the file, then only the rows
+    written after the start are yielded. A truncated or rotated file is
+    read again from the start. '-' reads from stdin until it is closed.
+    :param file_name: csv log or '-'
+    :param poll_interval: seconds to wait for new rows
+    :return: generator of DataFrames with string columns
+    """
+    if file_name == '-':
+        yield from follow_stdin()
+        return
+    f = open(file_name, 'r', newline='')
+    header = next(csv.reader([f.readline()]))
+    f.seek(0, os.SEEK_END)
+    partial = ''
+    # the header of a new file is skipped once its first line is complete
+    skip_header = False
+    try:
+        while True:
+            lines, partial = split_lines(partial + f.read())
+            if skip_header and lines:
+                lines = lines[1:]
+                skip_header = False
+            if lines:
+                yield rows_frame(lines, header)
+                continue
+            time.sleep(poll_interval)
+            try:
+                stat = os.stat(file_name)
+            except FileNotFoundError:
+                continue
+            if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+                # rotated or truncated: read the new file from the start
+                f.close()
+                f = open(file_name, 'r', newline='')
+                partial = ''
+                skip_header = True
+    finally:
+        f.close()
+
+
+def rows_frame(lines, header):
+    """
+    :param lines: csv lines without the header
+    :param header: column names
+    :return: DataFrame of the rows, rows with a wrong number of fields are skipped
+    """
+    rows = [row for row in csv.reader(io.StringIO('\n'.join(lines))) if len(row) == len(header)]
+    return pd.DataFrame(rows, columns=header)
+
+
+class SlidingWindowAlerts:
+    """
+    Sliding window count of the events of every key, alerting as soon as a
+    key has threshold events in the window (t - window, t].
+    A key keeps at most threshold timestamps: that is enough to know if the
+    threshold is reached. Keys are kept in the order of their last event, so
+    the keys without events in the current window are evicted from the front.
+    """
+    def __init__(self, window, threshold):
+        """
+        :param window: window length in nanoseconds
+        :param threshold: number of events in the window that raises an alert
+        """
+        self.window = window
+        self.threshold = threshold
+        self.events = OrderedDict()
+        self.alerted = set()
+
+    def add(self, key, t):
+        """
+        :param key: tuple of the key values
+        :param t: event time in nanoseconds
+        :return: True if the key just reached the threshold
+        """
+        events = self.events.get(key)
+        if events is None:
+            events = self.events[key] = deque(maxlen=self.threshold)
+        else:
+            self.events.move_to_end(key)
+        events.append(t)
+        while events[0] <= t - self.window:
+            events.popleft()
+        if len(events) < self.threshold:
+            self.alerted.discard(key)
+            return False
+        if key in self.alerted:
+            return False
+        self.alerted.add(key)
+        return True
+
+    def evict(self, now):
+        """
+        Forget the keys without events in the window ending at now
+        :param now: time in nanoseconds
+        :return: number of keys evicted
+        """
+        evicted = 0
+        while self.events:
+            key, events = next(iter(self.events.items()))
+            if events[-1] > now - self.window:
+                break
+            del self.events[key]
+            self.alerted.discard(key)
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self.events)
+
+
+def windowed_alerts(frames, keys, window_slice, threshold, time_format=None):
+    """
+    Alert as soon as a key has threshold events within window_slice
+    :param frames: DataFrames of the new rows, with _time and the key columns
+    :param keys: list of key columns
+    :param window_slice: time window, eg: '60s'
+    :param threshold: number of events in the window that raises an alert
+    :param time_format: TIME_FORMAT of _time, None to detect it on the first rows
+    :return: generator of (event time, key values)
+    """
+    alerts = SlidingWindowAlerts(pd.Timedelta(window_slice).value, threshold)
+    time_format = resolve_time_format(time_format)
+    for rows in frames:
+        if rows.empty:
+            continue
+        if time_format is None:
+            time_format = detect_time_format(rows['_time'])
+        # a malformed _time must not end the follow: its row is skipped
+        times = parse_time(rows['_time'], time_format, errors='coerce')
+        valid = times.notna().values
+        times = np.asarray(times.values, dtype='datetime64[ns]').view(np.int64)[valid]
+        if times.size == 0:
+            continue
+        columns = [rows[key].values[valid] for key in keys]
+        for t, key in zip(times, zip(*columns)):
+            if alerts.add(key, t):
+                yield pd.Timestamp(t), key
+        alerts.evict(times.max())
@@ -12,16 +12,23 @@ Changelog:
 """
 import sys
 import argparse
-import numpy as np
-import pandas as pd
-from joblib import load
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import IsolationForest
 import datetime
 import warnings
-from tqdm import tqdm
+from itertools import repeat
 warnings.simplefilter(action='ignore')
 
+try:
+    from lazy_loader import lazy_import, lazy_resource
+except:
+    print('* Lazy loader file not found! Error!')
+    sys.exit(1)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+sklearn = lazy_import('sklearn')
+ensemble = lazy_import('sklearn.ensemble')
+tqdm = lazy_import('tqdm')
+
 try:
     from config import *
     from config import __prog__, __version__
@@ -30,29 +37,96 @@ except:
     sys.exit(1)
 
 try:
-    from utils import is_dirs
+    from utils import is_dirs, read_dtypes, apply_schema, values_by_count, parse_time, sort_by_column, \
+        expand_file_names, select_analyses, load_log_files, merge_time_sorted, ResultCollector, \
+        process_pool
 except:
     print('* Utils file not found! Error!')
     sys.exit(1)
 
+try:
+    from ip_index import load_isp_index
+except:
+    print('* IP index file not found! Error!')
+    sys.exit(1)
+
+try:
+    from log_cache import ParsedLogCache
+except:
+    print('* Log cache file not found! Error!')
+    sys.exit(1)
+
+try:
+    from output_writer import OutputWriter, OUTPUT_FORMATS, check_output_format
+except:
+    print('* Output writer file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_profiler import StageProfiler, profiled_stage
+except:
+    print('* Stage profiler file not found! Error!')
+    sys.exit(1)
+
+def isolation_forest_options():
+    """
+    :return: IsolationForest keyword arguments depending on the sklearn version: behaviour='new'
+        gives the 'auto' contamination of sklearn 0.22+ on older versions, the argument was removed in 0.24
+    """
+    version = tuple(int(part) for part in sklearn.__version__.split('.')[:2] if part.isdigit())
+    return {'behaviour': 'new'} if version < (0, 22) else {}
+
+
+def get_outliers(data, random_state):
+    """
+    Fit an IsolationForest on the one hot encoded IP addresses of one
+    (date, user) slice. Kept at module level so it can run in worker processes.
+    :param data: DataFrame with _time, user and ipAddress
+    :param random_state: seed of the IsolationForest
+    :return: DataFrame of the outlier rows, None if there are none
+    """
+    if(data.shape[0] > 0):
+        d = np.asarray(data['ipAddress'], dtype=object)
+        d = pd.get_dummies(d)
+        outliers = ensemble.IsolationForest(contamination='auto', random_state=random_state,
+                                            **isolation_forest_options())\
+                    .fit_predict(d)
+        if((outliers == 1).any()):
+            return data.loc[outliers == -1, ['_time','user','ipAddress']]
+    return None
+
+
 class O365AnomalyDetector:
     def __init__(self):
+        self.known_isp_cache = {}
+        self.log_cache = ParsedLogCache(LOG_CACHE_DIR, LOG_CACHE_MAX_BYTES)
+        self.profiler = None
+        self.writer = OutputWriter(OUTPUT_FORMAT, OUTPUT_CHUNK_ROWS, OUTPUT_BACKGROUND)
+        self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+    @lazy_resource
+    def ip_isp(self):
+        """
+        IP to ISP index, loaded by the first ISP lookup
+        """
         try:
-            self.rtree = load(IP_ISP_RTREE_JOBLIB)
-            self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+            return load_isp_index(IP_ISP_INDEX, IP_ISP_RTREE_JOBLIB)
         except Exception as e:
             print('* ERROR IN READING TP TO ISP RADIX TREE : ', e)
             sys.exit(1)
 
+    @profiled_stage
     def read_csv_file(self, file_name):
         try:
             print('* Reading log file...')
-            self.data = pd.read_csv(file_name)
+            self.data = pd.read_csv(file_name, dtype=read_dtypes(O365_LOG_DTYPES))
+            self.data = apply_schema(self.data, O365_LOG_DTYPES)
             return True
         except Exception as e:
             print('* ERROR IN READING CSV FILE : ', e)
             return False
 
+    @profiled_stage
     def verify_columns(self):
         print('* Columns check...')
         columns = self.data.columns.values
@@ -60,10 +134,69 @@ class O365AnomalyDetector:
             return True
         return False
 
+    @profiled_stage
+    def sort_by_time(self):
+        try:
+            self.data['_time'] = parse_time(self.data['_time'], TIME_FORMAT)
+            self.data = sort_by_column(self.data, '_time')
+            return True
+        except Exception as e:
+            print('* ERROR IN CONVERTING INDEX TO DATETIME : ', e)
+            return False
+
+    @profiled_stage
+    def load_log(self, file_name):
+        """
+        Read, validate and time sort the log file. The parsed log is cached
+        under LOG_CACHE_DIR and reused while the file is unchanged.
+        :param file_name:
+        :return: True if the log was loaded
+        """
+        cache_key = None
+        if USE_LOG_CACHE:
+            cache_key = self.log_cache.key(file_name, O365_LOG_STD_COLS, 'o365', TIME_FORMAT)
+            self.data = self.log_cache.load(cache_key)
+            if self.data is not None:
+                print('* Parsed log loaded from cache...')
+                return True
+        if self.read_csv_file(file_name):
+            if self.verify_columns():
+                if self.sort_by_time():
+                    if cache_key is not None:
+                        self.log_cache.store(cache_key, self.data)
+                    return True
+                return False
+            else:
+                print('* Invalid columns found!')
+                print('* Column names must be : ', O365_LOG_STD_COLS)
+                sys.exit(1)
+        return False
+
+    @profiled_stage
+    def load_logs(self, file_names):
+        """
+        Read, validate and time sort several log files, parsed in parallel
+        on N_JOBS processes, and merge them in time order. Each file is parsed
+        (and cached) on its own, the windows that span two files are counted
+        on the merged log.
+        :param file_names: log file or list of log files
+        :return: True if all the logs were loaded
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        if len(file_names) == 1:
+            return self.load_log(file_names[0])
+        print('* Reading {} log files...'.format(len(file_names)))
+        settings = {'TIME_FORMAT': TIME_FORMAT, 'USE_LOG_CACHE': USE_LOG_CACHE}
+        frames = load_log_files(load_log_file, file_names, settings, N_JOBS)
+        if any(frame is None for frame in frames):
+            return False
+        self.data = merge_time_sorted(frames, '_time')
+        return True
+
+    @profiled_stage
     def extract_date_hour(self):
         try:
-            self.data['_time'] = pd.to_datetime(self.data['_time'])
-            self.data = self.data.sort_values(by='_time')
             self.data['login_date'] = pd.DatetimeIndex(self.data['_time']).date
             self.data['login_hour'] = pd.DatetimeIndex(self.data['_time']).hour
             return True
@@ -71,156 +204,213 @@ class O365AnomalyDetector:
             print('* ERROR IN CONVERTING INDEX TO DATETIME : ', e)
             return False
 
-    def get_ip_switch_per(self, date, user, ip_data):
-        self.row_no += 1
-        switch_per = 0.0
-        ip_data = LabelEncoder().fit_transform(ip_data)
-        try:
-            last_value = ip_data[0]
-            switch_count = 0
-            for d in ip_data[1:]:
-                if d != last_value:
-                    switch_count += 1
-                last_value = d
-            switch_per = switch_count / ip_data.size
-        except:
-            pass
-        self.ip_switch_df.loc[self.row_no, 'login_date'] = date
-        self.ip_switch_df.loc[self.row_no, 'user'] = user
-        self.ip_switch_df.loc[self.row_no, 'ip_switch_per'] = switch_per
-
+    @profiled_stage
     def user_ip_switch(self):
-        self.ip_switch_df = pd.DataFrame(columns=['login_date','user'])
-        self.row_no = self.ip_switch_df.shape[0]
-        for dt in self.login_date:
-            for usr in self.users_list:
-                self.get_ip_switch_per(dt, usr, \
-                                       self.data.loc[(self.data['login_date']==dt) \
-                                                     & (self.data['user']==usr), 'ipAddress']\
-                                       .values)
-        self.ip_switch_df.to_csv(os.path.join(ML_DIR, 'UsersIPSwitchRate_' + \
-                                              self.timestamp + '.csv'), index=None)
-
-    def get_outliers(self, data):
-        if(data.shape[0] > 0):
-            d = data['ipAddress'].values
-            d = pd.get_dummies(d)
-            data['outliers'] = IsolationForest(contamination='auto', behaviour='new')\
-                                .fit_predict(d)
-            if(data.loc[data['outliers']==1].shape[0] != 0):
-                self.ip_based_outlier_df = self.ip_based_outlier_df\
-                                        .append(data.loc[data['outliers']==-1,['_time','user','ipAddress']])
+        """
+        Rate of IP switch per user per day: the number of logins whose IP differs
+        from the previous login of the same user on the same day, over the
+        number of logins. Computed in one grouped pass over the time sorted data.
+        :return: DataFrame written
+        """
+        groups = self.data.groupby(['login_date', 'user'], sort=False, observed=True)
+        previous_ip = groups['ipAddress'].shift()
+        switched = (self.data['ipAddress'] != previous_ip) & (groups.cumcount() > 0)
+        switch_count = switched.groupby([self.data['login_date'], self.data['user']], sort=False, observed=True).sum()
+        switch_per = switch_count / groups.size()
+        all_pairs = pd.MultiIndex.from_product([self.login_date, self.users_list], names=['login_date', 'user'])
+        switch_per = switch_per.reindex(all_pairs, fill_value=0.0).astype(np.float64)
+        self.ip_switch_df = switch_per.reset_index(name='ip_switch_per')
+        self.writer.write(self.ip_switch_df, os.path.join(ML_DIR, 'UsersIPSwitchRate_' + self.timestamp))
+        return self.ip_switch_df
+
+    def is_known_isp(self, isp):
+        if(isp not in self.known_isp_cache):
+            self.known_isp_cache[isp] = isp is not None and any(name in isp for name in ISP_NAMES)
+        return self.known_isp_cache[isp]
 
     def isp_check(self, ip_adr):
-        response = self.rtree.search_best(ip_adr)
-        if(response != None):
-            if(ISP_NAME in response.data['isp']):
-                return True
-            else:
-                return False
-        return False
+        return self.known_isp_mask([ip_adr])[0]
 
+    def known_isp_mask(self, ips):
+        """
+        Vectorized isp_check. Every distinct IP is resolved once and the
+        enterprise ISP test is cached for each resolved ISP.
+        :param ips: array/Series of IP addresses
+        :return: boolean array, True where the IP belongs to one of ISP_NAMES
+        """
+        codes, unique_ips = pd.factorize(np.asarray(ips, dtype=object))
+        known = np.array([self.is_known_isp(isp) for isp in self.ip_isp.lookup(unique_ips)], dtype=bool)
+        return np.append(known, False)[codes]
+
+    @profiled_stage
     def drop_ip_with_known_isp(self):
         print('Dropping IP with known ISP : ')
-        ind_list = []
-        for i in range(self.ip_based_outlier_df.shape[0]):
-            if(self.isp_check(self.ip_based_outlier_df.loc[i, 'ipAddress'])):
-                ind_list.append(i)
-        self.ip_based_outlier_df = self.ip_based_outlier_df.drop(index=ind_list)
+        known = self.known_isp_mask(self.ip_based_outlier_df['ipAddress'])
+        self.ip_based_outlier_df = self.ip_based_outlier_df.loc[~known, :]
+        return self.ip_based_outlier_df
 
+    @profiled_stage
     def ipadr_based_outliers(self):
-        self.ip_based_outlier_df = pd.DataFrame(columns=['_time', 'user', 'ipAddress'])
-        for dt in tqdm(self.login_date):
-            for usr in self.users_list:
-                self.get_outliers(self.data.loc[(self.data['login_date']==dt) \
-                                                & (self.data['user']==usr), \
-                                                ['_time','user','ipAddress']])
-        self.ip_based_outlier_df = self.ip_based_outlier_df.reset_index(drop=True)
-        self.drop_ip_with_known_isp()
-        self.ip_based_outlier_df.to_csv(os.path.join(ML_DIR, 'UsersIPAddressAnomaly_' + \
-                                                     self.timestamp + '.csv'), index=None)
-
-    def daily_user_login_patterning(self, df, count=0):
-        date = df.loc[0,'login_date']
-        for usr in tqdm(self.users_list):
-            self.user_login_pattern_data.loc[count, 'date'] = date
-            self.user_login_pattern_data.loc[count, 'user'] = usr
-            zero_chk = 0
-            for hour in range(24):
-                status = df.loc[(df['user']==usr) & (df['login_hour']==hour), 'loginStatus'].values
-                if(len(status) == 0):
-                    self.user_login_pattern_data.loc[count, 'h'+str(hour)] = 0
-                else:
-                    if(status[0] == 'Success'):
-                        self.user_login_pattern_data.loc[count, 'h'+str(hour)] = 1
-                        zero_chk += 1
-                    else:
-                        self.user_login_pattern_data.loc[count, 'h'+str(hour)] = 0
-            if(zero_chk > 0):
-                count += 1
-        return count
-
-    def append_outlier_df(self, data):
-        if(type(self.user_login_based_outliers) == type(None)):
-            if(data.shape[0] != 0):
-                self.user_login_based_outliers = data
+        """
+        IP address outliers for each user on each day. The data is split into
+        (date, user) slices once and the models are fitted on N_JOBS processes.
+        Every model uses the same seed, so the output does not depend on N_JOBS.
+        :return: DataFrame written
+        """
+        slices = dict(tuple(self.data.groupby(['login_date', 'user'], sort=False, observed=True)\
+                                [['_time', 'user', 'ipAddress']]))
+        slices = [slices[(dt, usr)] for dt in self.login_date for usr in self.users_list if (dt, usr) in slices]
+        outliers = ResultCollector(['_time', 'user', 'ipAddress'], RESULT_SPILL_ROWS)
+        if N_JOBS > 1:
+            with process_pool(N_JOBS) as executor:
+                chunk_size = max(1, len(slices) // (N_JOBS * 4))
+                for data in tqdm.tqdm(executor.map(get_outliers, slices, repeat(RANDOM_STATE), chunksize=chunk_size),
+                                 total=len(slices)):
+                    outliers.add(data)
         else:
-            if(data.shape[0] != 0):
-                self.user_login_based_outliers = self.user_login_based_outliers.append(data)
+            for data in tqdm.tqdm(slices):
+                outliers.add(get_outliers(data, RANDOM_STATE))
+        self.ip_based_outlier_df = outliers.to_frame()
+        self.drop_ip_with_known_isp()
+        self.writer.write(self.ip_based_outlier_df, os.path.join(ML_DIR, 'UsersIPAddressAnomaly_' + self.timestamp))
+        return self.ip_based_outlier_df
+
+    @profiled_stage
+    def user_login_patterning(self):
+        """
+        Hour wise login pattern of every user on every day: 1 for the hours whose
+        first login succeeded, 0 otherwise. Users and dates are factorized and the
+        (user-day x 24) matrix is filled in a preallocated array in one go.
+        :return: (dates, user codes, matrix) for the user-days with at least one successful hour,
+                 ordered by date and then by users_list
+        """
+        first_login = self.data.drop_duplicates(['login_date', 'user', 'login_hour'])
+        date_codes = pd.Index(self.login_date).get_indexer(first_login['login_date'])
+        user_codes = pd.Index(self.users_list).get_indexer(first_login['user'])
+        # logins without a user or a date (-1 codes) belong to no user-day
+        known = (date_codes >= 0) & (user_codes >= 0)
+        first_login, date_codes, user_codes = first_login[known], date_codes[known], user_codes[known]
+        rows = date_codes * len(self.users_list) + user_codes
+        matrix = np.zeros((len(self.login_date) * len(self.users_list), 24), dtype=np.uint8)
+        np.add.at(matrix, (rows, first_login['login_hour'].values.astype(np.int64)),
+                  (first_login['loginStatus'] == 'Success').values.astype(np.uint8))
+        rows = np.flatnonzero(matrix.any(axis=1))
+        return self.login_date[rows // len(self.users_list)], rows % len(self.users_list), matrix[rows]
 
-    def get_login_outlier(self, data):
+    def get_login_outlier(self, user, dates, pattern):
         try:
-            if(data.shape[0] > 2):
-                isf_data = IsolationForest(random_state=8).fit_predict(data.drop(['user','date'], axis=1)\
-                                                                   .reset_index(drop=True).values)
-                data['outlier_tag'] = isf_data
-                outlier_data = data.loc[data['outlier_tag']==-1, :]
-                self.append_outlier_df(outlier_data[['user','date']])
+            if(pattern.shape[0] > 2):
+                isf_data = ensemble.IsolationForest(random_state=RANDOM_STATE).fit_predict(pattern)
+                self.login_outliers.add(pd.DataFrame({'user': user, 'date': dates[isf_data == -1]}))
         except:
             pass
 
+    @profiled_stage
     def user_login_anomaly(self):
         print('* User Login Patterning...')
-        count = 0
-        for dt in self.login_date:
-            count = self.daily_user_login_patterning(self.data.loc[self.data['login_date']==dt, \
-                                                           ['login_date','user',\
-                                                            'loginStatus','login_hour']]\
-                                             .reset_index(drop=True), count)
-        self.user_login_based_outliers = None
+        dates, user_codes, pattern = self.user_login_patterning()
+        self.login_outliers = ResultCollector(['user', 'date'], RESULT_SPILL_ROWS)
         print('* Getting login outliers...')
-        for usr in self.users_list:
-            self.get_login_outlier(self.user_login_pattern_data.loc[self.user_login_pattern_data['user']==usr])
-        self.user_login_based_outliers.to_csv(os.path.join(ML_DIR, 'UsersLoginAnomaly_' + \
-                                                     self.timestamp + '.csv'), index=None)
+        order = np.argsort(user_codes, kind='stable')
+        user_codes = user_codes[order]
+        starts = np.flatnonzero(np.diff(user_codes, prepend=-1))
+        for start, rows in zip(tqdm.tqdm(starts), np.split(order, starts[1:])):
+            self.get_login_outlier(self.users_list[user_codes[start]], dates[rows], pattern[rows])
+        self.user_login_based_outliers = self.login_outliers.to_frame()
+        self.writer.write(self.user_login_based_outliers, os.path.join(ML_DIR, 'UsersLoginAnomaly_' + self.timestamp))
+        return self.user_login_based_outliers
 
-    def perform_analysis(self, file_name):
-        if self.read_csv_file(file_name):
-            if self.verify_columns():
-                if self.extract_date_hour():
-                    try:
-                        print('* Profiling...')
-                        self.login_date = np.sort(self.data['login_date'].value_counts().index.values)
-                        self.users_list = self.data['user'].value_counts().index.values
-                        self.user_ip_switch()
-                        self.ipadr_based_outliers()
-                        user_login_pattern_cols = ['date', 'user'] + ['h'+str(i) for i in range(24)]
-                        self.user_login_pattern_data = pd.DataFrame(columns=user_login_pattern_cols)
-                        self.user_login_anomaly()
-                    except Exception as e:
-                        print('* ERROR IN PERFORMING ANALYSIS : ', e)
-                        sys.exit(1)
-            else:
-                print('* Invalid columns found!')
-                print('* Column names must be : ', O365_LOG_STD_COLS)
+    def perform_analysis(self, file_name, data=None):
+        """
+        Begin anomaly detection for the provided log file.
+        :param file_name: log file or list of log files
+        :param data: log already read, validated and time sorted (see load_log).
+                     When given, file_name is not read again
+        :return:
+        """
+        if PROFILE:
+            self.profiler = self.writer.profiler = StageProfiler('anomalies', OUTPUT_DIR, self.timestamp,
+                                                                 PROFILE_TRACE_MEMORY, PROFILE_STAGE)
+        if data is not None:
+            self.data = data.copy(deep=False)
+        elif not self.load_logs(file_name):
+            return
+        if self.extract_date_hour():
+            try:
+                print('* Profiling...')
+                self.login_date = np.sort(self.data['login_date'].value_counts().index.values)
+                self.users_list = values_by_count(self.data['user'])
+                analyses = ANOMALY_ANALYSES if ONLY_ANALYSES is None else ONLY_ANALYSES
+                if 'ip_switch' in analyses:
+                    self.user_ip_switch()
+                if 'ip_outliers' in analyses:
+                    self.ipadr_based_outliers()
+                if 'login_anomaly' in analyses:
+                    self.user_login_anomaly()
+                self.writer.close()
+            except Exception as e:
+                print('* ERROR IN PERFORMING ANALYSIS : ', e)
                 sys.exit(1)
+        if PROFILE:
+            print('* Profile report: {}'.format(', '.join(self.profiler.write_report())))
+
+
+def load_log_file(file_name, settings):
+    """
+    Read, validate and time sort one log file. Kept at module level so it
+    can run in worker processes.
+    :param file_name:
+    :param settings: settings of the parent process, eg: TIME_FORMAT
+    :return: DataFrame, None if the log could not be loaded
+    """
+    globals().update(settings)
+    analyzer = O365AnomalyDetector()
+    if analyzer.load_log(file_name):
+        return analyzer.data
+    return None
 
 
 if __name__ == '__main__':
     print('* {}  v{}: O365'.format(__prog__, __version__))
     parser = argparse.ArgumentParser(description=__prog__, prog=__prog__)
-    parser.add_argument('filename')
+    parser.add_argument('filename', nargs='+', help='Log files or glob patterns, eg: "logs/*.csv"')
+    parser.add_argument('-j', '--jobs', default=N_JOBS, type=int, help='Number of worker processes')
+    parser.add_argument('-i', '--isp-name', action='append',
+                        help='ISP name of the enterprise, can be given several times (default: {})'.format(ISP_NAMES))
+    parser.add_argument('-t', '--time-format', default=TIME_FORMAT,
+                        help="Format of _time: strftime format or 'splunk', 'iso8601', 'epoch_s', 'epoch_ms' "
+                             "(default: detected from the log)")
+    parser.add_argument('--only', help='Comma separated analyses to run, among {} (default: all)'
+                        .format(','.join(ANOMALY_ANALYSES)))
+    parser.add_argument('--output-format', default=OUTPUT_FORMAT, choices=list(OUTPUT_FORMATS),
+                        help='Format of the output files')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the parsed log cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the time, memory and row counts of every stage to OUTPUT_DIR')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also measure the memory allocated by every stage with tracemalloc (slower)')
+    parser.add_argument('--profile-stage', default=PROFILE_STAGE,
+                        help='Stage to run under cProfile, eg: ipadr_based_outliers (implies --profile)')
     args = parser.parse_args()
+    OUTPUT_FORMAT = args.output_format
+    try:
+        check_output_format(OUTPUT_FORMAT)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    USE_LOG_CACHE = not args.no_cache
+    PROFILE_TRACE_MEMORY = args.profile_memory
+    PROFILE_STAGE = args.profile_stage
+    PROFILE = args.profile or PROFILE_TRACE_MEMORY or PROFILE_STAGE is not None
+    TIME_FORMAT = args.time_format
+    N_JOBS = args.jobs
+    if args.isp_name:
+        ISP_NAMES = args.isp_name
+    try:
+        ONLY_ANALYSES = select_analyses(args.only, ANOMALY_ANALYSES)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
 
     if not os.access(RESOURCES_DIR, os.F_OK):
         print("* Error accessing '{}' folder! Exiting...!".format(RESOURCES_DIR))
@@ -229,12 +419,23 @@ if __name__ == '__main__':
     is_dirs(ML_DIR, OUTPUT_DIR)  # check if folders exist, else create them
 
     if args.filename:
-        file_name = args.filename
-        if not os.access(file_name, os.F_OK):
-            print("* Error accessing '{}'! Exiting...!".format(file_name))
+        file_names = expand_file_names(args.filename)
+        if not file_names:
+            print("* No log file matches '{}'! Exiting...!".format(' '.join(args.filename)))
             sys.exit(1)
+        for name in file_names:
+            if not os.access(name, os.F_OK):
+                print("* Error accessing '{}'! Exiting...!".format(name))
+                sys.exit(1)
+        print('* params:')
+        print('  --jobs: {}'.format(N_JOBS))
+        print('  --isp-name: {}'.format(ISP_NAMES))
+        print('  --time-format: {}'.format(TIME_FORMAT))
+        print('  --output-format: {}'.format(OUTPUT_FORMAT))
+        print('  --only: {}'.format(','.join(ONLY_ANALYSES)))
+        print('  --profile: {}'.format(PROFILE))
         oad = O365AnomalyDetector()
-        oad.perform_analysis(file_name)
+        oad.perform_analysis(file_names)
     else:
         print('* Example: ')
         print('* {} /path/to/log_file.csv'.format(__file__))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+O365 Combined: This file runs the O365 analytics and the O365 anomaly detection on a single parse of the log
+Version: 1.1
+Changelog:
+    v1.1        One parse runner for o365_log_analysis and o365_anomalies
+"""
+import sys
+import argparse
+
+try:
+    from config import *
+    from config import __prog__, __version__
+except:
+    print('* Config file not found! Error!')
+    sys.exit(1)
+
+try:
+    from utils import is_dirs, check_window_slice, expand_file_names, select_analyses
+except:
+    print('* Utils file not found! Error!')
+    sys.exit(1)
+
+try:
+    import o365_log_analysis
+    import o365_anomalies
+except:
+    print('* O365 analyser files not found! Error!')
+    sys.exit(1)
+
+try:
+    from output_writer import OUTPUT_FORMATS, check_output_format
+except:
+    print('* Output writer file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_profiler import StageProfiler
+except:
+    print('* Stage profiler file not found! Error!')
+    sys.exit(1)
+
+
+def perform_analysis(file_name):
+    """
+    Read, validate and time sort the log once and hand the same frame to
+    the O365LogAnalyzer and the O365AnomalyDetector. With PROFILE, both
+    record their stages in one profile report. An analyser without any
+    analysis selected with --only is skipped.
+    :param file_name: log file or list of log files
+    :return:
+    """
+    ola = o365_log_analysis.O365LogAnalyzer()
+    oad = o365_anomalies.O365AnomalyDetector()
+    oad.timestamp = ola.timestamp
+    if PROFILE:
+        ola.profiler = oad.profiler = ola.writer.profiler = oad.writer.profiler = \
+            StageProfiler('o365_combined', OUTPUT_DIR, ola.timestamp, PROFILE_TRACE_MEMORY, PROFILE_STAGE)
+    if ola.load_logs(file_name):
+        data = ola.data
+        if o365_log_analysis.ONLY_ANALYSES != []:
+            ola.perform_analysis(file_name, data=data)
+        if o365_anomalies.ONLY_ANALYSES != []:
+            oad.perform_analysis(file_name, data=data)
+    if PROFILE:
+        print('* Profile report: {}'.format(', '.join(ola.profiler.write_report())))
+
+
+if __name__ == '__main__':
+    print('* {}  v{}: O365 Combined'.format(__prog__, __version__))
+    print('* Update the Blacklisted IP database if you haven\'t done so in the last 24hrs!')
+    parser = argparse.ArgumentParser(description=__prog__, prog=__prog__)
+    parser.add_argument('filename', nargs='+', help='Log files or glob patterns, eg: "logs/*.csv"')
+    parser.add_argument('-w', '--window-slice', default=WINDOW_SLICE, help='Time Window bucket in seconds')
+    parser.add_argument('-j', '--jobs', default=N_JOBS, type=int, help='Number of worker processes')
+    parser.add_argument('-i', '--isp-name', action='append',
+                        help='ISP name of the enterprise, can be given several times (default: {})'.format(ISP_NAMES))
+    parser.add_argument('-t', '--time-format', default=TIME_FORMAT,
+                        help="Format of _time: strftime format or 'splunk', 'iso8601', 'epoch_s', 'epoch_ms' "
+                             "(default: detected from the log)")
+    parser.add_argument('--incremental', action='store_true',
+                        help='Add the log to the counts of the logs analysed before (state in {})'.format(STATE_DIR))
+    parser.add_argument('--threads', default=ANALYSIS_THREADS, type=int,
+                        help='Number of analyses run at the same time')
+    parser.add_argument('--only', help='Comma separated analyses to run, among {} (default: all)'
+                        .format(','.join(O365_ANALYSES + ANOMALY_ANALYSES)))
+    parser.add_argument('--output-format', default=OUTPUT_FORMAT, choices=list(OUTPUT_FORMATS),
+                        help='Format of the output files')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the parsed log cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the time, memory and row counts of every stage to OUTPUT_DIR')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also measure the memory allocated by every stage with tracemalloc (slower)')
+    parser.add_argument('--profile-stage', default=PROFILE_STAGE,
+                        help='Stage to run under cProfile, eg: ipadr_based_outliers (implies --profile)')
+    args = parser.parse_args()
+    PROFILE_TRACE_MEMORY = args.profile_memory
+    PROFILE_STAGE = args.profile_stage
+    PROFILE = args.profile or PROFILE_TRACE_MEMORY or PROFILE_STAGE is not None
+    o365_log_analysis.WINDOW_SLICE = check_window_slice(args.window_slice)
+    o365_log_analysis.N_JOBS = o365_anomalies.N_JOBS = args.jobs
+    o365_log_analysis.ANALYSIS_THREADS = args.threads
+    o365_log_analysis.USE_LOG_CACHE = not args.no_cache
+    o365_log_analysis.TIME_FORMAT = args.time_format
+    o365_log_analysis.OUTPUT_FORMAT = o365_anomalies.OUTPUT_FORMAT = args.output_format
+    try:
+        check_output_format(args.output_format)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    o365_log_analysis.INCREMENTAL = args.incremental
+    if args.isp_name:
+        o365_anomalies.ISP_NAMES = args.isp_name
+    try:
+        only = select_analyses(args.only, O365_ANALYSES + ANOMALY_ANALYSES)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    o365_log_analysis.ONLY_ANALYSES = [name for name in only if name in O365_ANALYSES]
+    o365_anomalies.ONLY_ANALYSES = [name for name in only if name in ANOMALY_ANALYSES]
+    if args.only and args.incremental:
+        print('* --only cannot be used with --incremental, the windows of the other analyses would miss the log! '
+              'Exiting...!')
+        sys.exit(1)
+
+    if not os.access(RESOURCES_DIR, os.F_OK):
+        print("* Error accessing '{}' folder! Exiting...!".format(RESOURCES_DIR))
+        sys.exit(1)
+
+    is_dirs(ML_DIR, OUTPUT_DIR)  # check if folders exist, else create them
+
+    if args.filename:
+        file_names = expand_file_names(args.filename)
+        if not file_names:
+            print("* No log file matches '{}'! Exiting...!".format(' '.join(args.filename)))
+            sys.exit(1)
+        for name in file_names:
+            if not os.access(name, os.F_OK):
+                print("* Error accessing '{}'! Exiting...!".format(name))
+                sys.exit(1)
+
+        print('* params:')
+        print('  --window-slice: {}'.format(o365_log_analysis.WINDOW_SLICE))
+        print('  --jobs: {}'.format(o365_anomalies.N_JOBS))
+        print('  --threads: {}'.format(o365_log_analysis.ANALYSIS_THREADS))
+        print('  --isp-name: {}'.format(o365_anomalies.ISP_NAMES))
+        print('  --time-format: {}'.format(o365_log_analysis.TIME_FORMAT))
+        print('  --output-format: {}'.format(o365_log_analysis.OUTPUT_FORMAT))
+        print('  --incremental: {}'.format(o365_log_analysis.INCREMENTAL))
+        print('  --only: {}'.format(','.join(only)))
+        print('  --profile: {}'.format(PROFILE))
+        perform_analysis(file_names)
+    else:
+        print('* Example: ')
+        print('* {} /path/to/log_file.csv'.format(__file__))
+        sys.exit(1)
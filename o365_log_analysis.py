@@ -12,14 +12,19 @@ Changelog:
 """
 import sys
 import argparse
-import numpy as np
-import pandas as pd
-import geoip2.database
-from joblib import load
 import datetime
 import warnings
 warnings.simplefilter(action='ignore')
 
+try:
+    from lazy_loader import lazy_import, lazy_resource
+except:
+    print('* Lazy loader file not found! Error!')
+    sys.exit(1)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
 try:
     from config import *
     from config import __prog__, __version__
@@ -33,25 +38,80 @@ except:
     print('* Utils file not found! Error!')
     sys.exit(1)
 
+try:
+    from ip_index import load_blacklist
+except:
+    print('* IP index file not found! Error!')
+    sys.exit(1)
+
+try:
+    from log_cache import ParsedLogCache
+except:
+    print('* Log cache file not found! Error!')
+    sys.exit(1)
+
+try:
+    from window_state import AnalysisState
+except:
+    print('* Window state file not found! Error!')
+    sys.exit(1)
+
+try:
+    from log_follower import follow_csv, windowed_alerts
+except:
+    print('* Log follower file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_executor import StageExecutor
+except:
+    print('* Stage executor file not found! Error!')
+    sys.exit(1)
+
+try:
+    from output_writer import OutputWriter, OUTPUT_FORMATS, check_output_format
+except:
+    print('* Output writer file not found! Error!')
+    sys.exit(1)
+
+try:
+    from stage_profiler import StageProfiler, profiled_stage
+except:
+    print('* Stage profiler file not found! Error!')
+    sys.exit(1)
+
 
 class O365LogAnalyzer:
     def __init__(self):
+        self.log_cache = ParsedLogCache(LOG_CACHE_DIR, LOG_CACHE_MAX_BYTES)
+        self.state = None
+        self.profiler = None
+        self.writer = OutputWriter(OUTPUT_FORMAT, OUTPUT_CHUNK_ROWS, OUTPUT_BACKGROUND)
+        self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+    @lazy_resource
+    def blacklisted_ip(self):
+        """
+        Blacklisted IP index, loaded by the first blacklist check
+        """
         try:
-            self.blacklisted_ip = load(BLACKLISTED_IP_TRIE_JOBLIB)
-            self.timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+            return load_blacklist(BLACKLISTED_IP_INDEX, BLACKLISTED_IP_TRIE_JOBLIB)
         except Exception as e:
-            print('* ERROR IN READING GEOIP DATABASE : ', e)
+            print('* ERROR IN READING BLACKLISTED IP DATABASE : ', e)
             sys.exit(1)
 
+    @profiled_stage
     def read_csv_file(self, file_name):
         try:
             print('* Reading log file...')
-            self.data = pd.read_csv(file_name)
+            self.data = pd.read_csv(file_name, dtype=read_dtypes(O365_LOG_DTYPES))
+            self.data = apply_schema(self.data, O365_LOG_DTYPES)
             return True
         except Exception as e:
             print('* ERROR IN READING CSV FILE : ', e)
             return False
 
+    @profiled_stage
     def verify_columns(self):
         print('* Columns check...')
         columns = self.data.columns.values
@@ -59,10 +119,69 @@ class O365LogAnalyzer:
             return True
         return False
 
+    @profiled_stage
+    def sort_by_time(self):
+        try:
+            self.data['_time'] = parse_time(self.data['_time'], TIME_FORMAT)
+            self.data = sort_by_column(self.data, '_time')
+            return True
+        except Exception as e:
+            print('* ERROR IN CONVERTING INDEX TO DATETIME : ', e)
+            return False
+
+    @profiled_stage
+    def load_log(self, file_name):
+        """
+        Read, validate and time sort the log file. The parsed log is cached
+        under LOG_CACHE_DIR and reused while the file is unchanged.
+        :param file_name:
+        :return: True if the log was loaded
+        """
+        cache_key = None
+        if USE_LOG_CACHE:
+            cache_key = self.log_cache.key(file_name, O365_LOG_STD_COLS, 'o365', TIME_FORMAT)
+            self.data = self.log_cache.load(cache_key)
+            if self.data is not None:
+                print('* Parsed log loaded from cache...')
+                return True
+        if self.read_csv_file(file_name):
+            if self.verify_columns():
+                if self.sort_by_time():
+                    if cache_key is not None:
+                        self.log_cache.store(cache_key, self.data)
+                    return True
+                return False
+            else:
+                print('* Invalid columns found!')
+                print('* Column names must be : ', O365_LOG_STD_COLS)
+                sys.exit(1)
+        return False
+
+    @profiled_stage
+    def load_logs(self, file_names):
+        """
+        Read, validate and time sort several log files, parsed in parallel
+        on N_JOBS processes, and merge them in time order. Each file is parsed
+        (and cached) on its own, the windows that span two files are counted
+        on the merged log.
+        :param file_names: log file or list of log files
+        :return: True if all the logs were loaded
+        """
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        if len(file_names) == 1:
+            return self.load_log(file_names[0])
+        print('* Reading {} log files...'.format(len(file_names)))
+        settings = {'TIME_FORMAT': TIME_FORMAT, 'USE_LOG_CACHE': USE_LOG_CACHE}
+        frames = load_log_files(load_log_file, file_names, settings, N_JOBS)
+        if any(frame is None for frame in frames):
+            return False
+        self.data = merge_time_sorted(frames, '_time')
+        return True
+
+    @profiled_stage
     def datetime_index(self):
         try:
-            self.data['_time'] = pd.to_datetime(self.data['_time'])
-            self.data = self.data.sort_values(by='_time')
             self.data.index = self.data['_time']
             self.data = self.data.drop('_time', axis=1)
             return True
@@ -73,93 +192,223 @@ class O365LogAnalyzer:
     def check_blacklisted_ip(self, ip):
         return ip in self.blacklisted_ip
 
+    @profiled_stage
+    def windowed_max_count(self, state_name, df, keys, window_slice, name):
+        """
+        Windowed max count of the log, or of all the logs analysed so far in
+        incremental mode (see utils.windowed_max_count)
+        :param state_name: name the state is stored under
+        :return: DataFrame with the keys and the max count, sorted by keys
+        """
+        if self.state is not None:
+            return self.state.windowed_max_count(state_name, df, keys, window_slice, name)
+        return windowed_max_count(df, keys, window_slice, name)
+
+    def login_count(self, state_name, login_status):
+        """
+        Number of logins of each user with the given status, or of all the
+        logs analysed so far in incremental mode
+        :param state_name: name the state is stored under
+        :param login_status: 'Success' / 'Failure'
+        :return: Series of counts indexed by user
+        """
+        counts = self.data.loc[self.data['loginStatus'] == login_status, :].groupby(['user'], observed=True)['ipAddress']\
+                     .count()
+        if self.state is not None:
+            counts = self.state.cumulative_count(state_name, counts)
+        return counts
+
+    @profiled_stage
     def failed_successful_login_count(self):
         """
         Use-case:- Failed & Successful Login count
-        :return:
+        :return: DataFrame written
         """
-        failed_login_df = self.data.loc[self.data['loginStatus'] == 'Failure', :].groupby(['user'])['ipAddress']\
-                                .count()\
+        failed_login_df = self.login_count('failed_login', 'Failure')\
                                 .reset_index(name='failed_login_count')\
                                 .sort_values(['failed_login_count'], ascending=False)
-        successful_login_df = self.data.loc[self.data['loginStatus'] == 'Success', :].groupby(['user'])['ipAddress']\
-                                .count()\
+        successful_login_df = self.login_count('successful_login', 'Success')\
                                 .reset_index(name='successful_login_count')\
                                 .sort_values(['successful_login_count'], ascending=False)
         failed_login_df = pd.merge(failed_login_df, successful_login_df, how='outer', on='user').fillna(0).sort_values(by='user')
-        failed_login_df.to_csv(os.path.join(OUTPUT_DIR, 'SuccessFailureLoginCount_' + self.timestamp + '.csv'), index=None)
+        self.writer.write(failed_login_df, os.path.join(OUTPUT_DIR, 'SuccessFailureLoginCount_' + self.timestamp))
+        return failed_login_df
 
+    @profiled_stage
     def failed_login_based_on_os(self, df):
-        df = df.groupby(['user', 'os'])\
-               .rolling(WINDOW_SLICE)\
-               .agg({'loginStatus': 'count'})\
-               .groupby(['user', 'os'])\
-               .max()\
-               .reset_index()
-        df = df.rename(columns={'loginStatus': 'failed_login_count'})
+        df = self.windowed_max_count('failed_login_os', df, ['user', 'os'], WINDOW_SLICE, 'failed_login_count')
         df = df.sort_values(by='user')
-        df.to_csv(os.path.join(OUTPUT_DIR, 'FailedLoginFromDifferentOS_' + self.timestamp + '.csv'), index=None)
+        self.writer.write(df, os.path.join(OUTPUT_DIR, 'FailedLoginFromDifferentOS_' + self.timestamp))
+        return df
 
+    @profiled_stage
     def failed_login_based_on_ip(self, df):
-        df = df.groupby(['user','ipAddress'])\
-               .rolling(WINDOW_SLICE)\
-               .agg({'loginStatus': 'count'})\
-               .groupby(['user', 'ipAddress'])\
-               .max()\
-               .reset_index()
-        df = df.rename(columns={'loginStatus': 'failed_login_count'})
+        df = self.windowed_max_count('failed_login_ip', df, ['user', 'ipAddress'], WINDOW_SLICE, 'failed_login_count')
         df = df.sort_values(by='user')
-        df['mal_ip'] = df['ipAddress'].map(lambda x: self.check_blacklisted_ip(x))
+        df['mal_ip'] = self.blacklisted_ip.contains(df['ipAddress'])
         df = df[['user', 'ipAddress', 'mal_ip', 'failed_login_count']]
-        df.to_csv(os.path.join(OUTPUT_DIR, 'FailedLoginFromDifferentIP_' + self.timestamp + '.csv'), index=None)
+        self.writer.write(df, os.path.join(OUTPUT_DIR, 'FailedLoginFromDifferentIP_' + self.timestamp))
+        return df
 
+    @profiled_stage
     def max_login_failure_time_window(self, df):
-        df = df.groupby(['user'])\
-                .rolling('60s')\
-                .agg({'loginStatus': 'sum'})\
-                .groupby(['user'])\
-                .max()\
-                .sort_values(by='loginStatus', ascending=False)\
-                .reset_index()
-        df = df.rename(columns={'loginStatus': 'failed_login_count'})
-        df.to_csv(os.path.join(OUTPUT_DIR, 'MaxLoginFailureByEachUserInWindowedTimeFrame_' + self.timestamp + '.csv'), index=None)
-
-    def split_device_info_column(self):
-        sys_df = self.data['deviceInformation'].str.split(';', expand=True).drop(3,axis=1)
+        df = self.windowed_max_count('max_login_failure', df, ['user'], '60s', 'failed_login_count')\
+                .sort_values(by='failed_login_count', ascending=False)\
+                .reset_index(drop=True)
+        self.writer.write(df, os.path.join(OUTPUT_DIR, 'MaxLoginFailureByEachUserInWindowedTimeFrame_' + self.timestamp))
+        return df
+
+    @profiled_stage
+    def split_device_info_column(self, df):
+        """
+        :param df: logins
+        :return: logins with the system, os and browser of their deviceInformation
+        """
+        sys_df = df['deviceInformation'].str.split(';', expand=True).drop(3,axis=1)
         sys_df = sys_df.rename(columns={0:'system', 1:'os', 2:'browser'})
-        self.data = pd.concat([self.data, sys_df], sort=False, axis=1)
+        return pd.concat([df, sys_df], sort=False, axis=1)
 
-    def perform_analysis(self, file_name):
-        if self.read_csv_file(file_name):
-            if self.verify_columns():
-                if self.datetime_index():
-                    try:
-                        print('* Profiling...')
-                        self.failed_successful_login_count()
-                        self.split_device_info_column()
-                        failed_login_df = self.data.loc[self.data['loginStatus'] == 'Failure', :]
-                        failed_login_df['loginStatus'] = 1
-                        self.failed_login_based_on_os(failed_login_df)
-                        self.failed_login_based_on_ip(failed_login_df)
-                        self.max_login_failure_time_window(failed_login_df)
-                    except Exception as e:
-                        print('* ERROR IN PERFORMING ANALYSIS : ', e)
-                        sys.exit(1)
-            else:
-                print('* Invalid columns found!')
-                print('* Column names must be : ', O365_LOG_STD_COLS)
+    @profiled_stage
+    def failed_logins(self):
+        """
+        :return: DataFrame of the failed logins, loginStatus set to 1
+        """
+        failed_login_df = self.data.loc[self.data['loginStatus'] == 'Failure', :]
+        failed_login_df['loginStatus'] = 1
+        return failed_login_df
+
+    def follow(self, file_name):
+        """
+        Use-case:- Real-time alerts. Tail the log and alert as soon as a user has
+        O365_ALERT_THRESHOLD failed logins from one IP within the window
+        :param file_name: log file, '-' for stdin
+        :return:
+        """
+        print('* Following {}...'.format(file_name))
+        frames = (rows.loc[rows['loginStatus'] == 'Failure', :] for rows in follow_csv(file_name, FOLLOW_POLL_INTERVAL))
+        for time, (user, ip) in windowed_alerts(frames, ['user', 'ipAddress'], WINDOW_SLICE,
+                                                O365_ALERT_THRESHOLD, TIME_FORMAT):
+            print('* ALERT {} : {} failed logins within {} for {} from {}{}'.format(
+                time, O365_ALERT_THRESHOLD, WINDOW_SLICE, user,
+                ip, ' (blacklisted)' if self.check_blacklisted_ip(ip) else ''), flush=True)
+
+    def perform_analysis(self, file_name, data=None):
+        """
+        Begin analytics for the provided log file.
+        :param file_name: log file or list of log files
+        :param data: log already read, validated and time sorted (see load_log).
+                     When given, file_name is not read again
+        :return:
+        """
+        if PROFILE:
+            self.profiler = self.writer.profiler = StageProfiler('o365', OUTPUT_DIR, self.timestamp,
+                                                                 PROFILE_TRACE_MEMORY, PROFILE_STAGE)
+        if data is not None:
+            self.data = data.copy(deep=False)
+        elif not self.load_logs(file_name):
+            return
+        if self.datetime_index():
+            try:
+                if INCREMENTAL:
+                    self.state = AnalysisState(os.path.join(STATE_DIR, 'o365.pkl'))
+                    self.state.load()
+                    self.state.check_order(self.data)
+                print('* Profiling...')
+                analyses = O365_ANALYSES if ONLY_ANALYSES is None else ONLY_ANALYSES
+                executor = StageExecutor()
+                if 'login_count' in analyses:
+                    executor.add('login_count', self.failed_successful_login_count)
+                if {'os', 'ip', 'max_failure'} & set(analyses):
+                    executor.add('failed_logins', self.failed_logins)
+                if 'os' in analyses:
+                    executor.add('failed_login_devices', self.split_device_info_column, ['failed_logins'])
+                    executor.add('os', self.failed_login_based_on_os, ['failed_login_devices'])
+                if 'ip' in analyses:
+                    executor.add('ip', self.failed_login_based_on_ip, ['failed_logins'])
+                if 'max_failure' in analyses:
+                    executor.add('max_failure', self.max_login_failure_time_window, ['failed_logins'])
+                executor.run(ANALYSIS_THREADS)
+                self.writer.close()
+                if self.state is not None:
+                    self.state.save()
+            except Exception as e:
+                print('* ERROR IN PERFORMING ANALYSIS : ', e)
                 sys.exit(1)
+        if PROFILE:
+            print('* Profile report: {}'.format(', '.join(self.profiler.write_report())))
+
+
+def load_log_file(file_name, settings):
+    """
+    Read, validate and time sort one log file. Kept at module level so it
+    can run in worker processes.
+    :param file_name:
+    :param settings: settings of the parent process, eg: TIME_FORMAT
+    :return: DataFrame, None if the log could not be loaded
+    """
+    globals().update(settings)
+    analyzer = O365LogAnalyzer()
+    if analyzer.load_log(file_name):
+        return analyzer.data
+    return None
 
 
 if __name__ == '__main__':
     print('* {}  v{}: O365'.format(__prog__, __version__))
     print('* Update the Blacklisted IP database if you haven\'t done so in the last 24hrs!')
     parser = argparse.ArgumentParser(description=__prog__, prog=__prog__)
-    parser.add_argument('filename')
+    parser.add_argument('filename', nargs='+', help='Log files or glob patterns, eg: "logs/*.csv"')
     parser.add_argument('-w', '--window-slice', default=WINDOW_SLICE, help='Time Window bucket in seconds')
+    parser.add_argument('-j', '--jobs', default=N_JOBS, type=int, help='Number of processes parsing the log files')
+    parser.add_argument('-t', '--time-format', default=TIME_FORMAT,
+                        help="Format of _time: strftime format or 'splunk', 'iso8601', 'epoch_s', 'epoch_ms' "
+                             "(default: detected from the log)")
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help="Follow the log as it grows ('-' reads stdin) and print alerts")
+    parser.add_argument('--threshold', default=O365_ALERT_THRESHOLD, type=int,
+                        help='Failed logins within the window that raise an alert in follow mode')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Add the log to the counts of the logs analysed before (state in {})'.format(STATE_DIR))
+    parser.add_argument('--threads', default=ANALYSIS_THREADS, type=int,
+                        help='Number of analyses run at the same time')
+    parser.add_argument('--only', help='Comma separated analyses to run, among {} (default: all)'
+                        .format(','.join(O365_ANALYSES)))
+    parser.add_argument('--output-format', default=OUTPUT_FORMAT, choices=list(OUTPUT_FORMATS),
+                        help='Format of the output files')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the parsed log cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write the time, memory and row counts of every stage to OUTPUT_DIR')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also measure the memory allocated by every stage with tracemalloc (slower)')
+    parser.add_argument('--profile-stage', default=PROFILE_STAGE,
+                        help='Stage to run under cProfile, eg: failed_login_based_on_ip (implies --profile)')
     args = parser.parse_args()
+    OUTPUT_FORMAT = args.output_format
+    try:
+        check_output_format(OUTPUT_FORMAT)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    USE_LOG_CACHE = not args.no_cache
+    PROFILE_TRACE_MEMORY = args.profile_memory
+    PROFILE_STAGE = args.profile_stage
+    PROFILE = args.profile or PROFILE_TRACE_MEMORY or PROFILE_STAGE is not None
+    INCREMENTAL = args.incremental
+    TIME_FORMAT = args.time_format
+    N_JOBS = args.jobs
+    ANALYSIS_THREADS = args.threads
     WINDOW_SLICE = args.window_slice
     WINDOW_SLICE = check_window_slice(WINDOW_SLICE)
+    O365_ALERT_THRESHOLD = args.threshold
+    try:
+        ONLY_ANALYSES = select_analyses(args.only, O365_ANALYSES)
+    except ValueError as e:
+        print('* {}! Exiting...!'.format(e))
+        sys.exit(1)
+    if args.only and INCREMENTAL:
+        print('* --only cannot be used with --incremental, the windows of the other analyses would miss the log! '
+              'Exiting...!')
+        sys.exit(1)
 
     if not os.access(RESOURCES_DIR, os.F_OK):
         print("* Error accessing '{}' folder! Exiting...!".format(RESOURCES_DIR))
@@ -168,15 +417,36 @@ if __name__ == '__main__':
     is_dirs(ML_DIR, OUTPUT_DIR)  # check if folders exist, else create them
 
     if args.filename:
-        file_name = args.filename
-        if not os.access(file_name, os.F_OK):
-            print("* Error accessing '{}'! Exiting...!".format(file_name))
+        file_names = expand_file_names(args.filename)
+        if not file_names:
+            print("* No log file matches '{}'! Exiting...!".format(' '.join(args.filename)))
+            sys.exit(1)
+        for name in file_names:
+            if name != '-' and not os.access(name, os.F_OK):
+                print("* Error accessing '{}'! Exiting...!".format(name))
+                sys.exit(1)
+        if args.follow and len(file_names) != 1:
+            print('* Only one log file can be followed! Exiting...!')
             sys.exit(1)
 
         print('* params:')
         print('  --window-slice: {}'.format(WINDOW_SLICE))
+        print('  --jobs: {}'.format(N_JOBS))
+        print('  --threads: {}'.format(ANALYSIS_THREADS))
+        print('  --time-format: {}'.format(TIME_FORMAT))
+        print('  --output-format: {}'.format(OUTPUT_FORMAT))
+        print('  --incremental: {}'.format(INCREMENTAL))
+        print('  --only: {}'.format(','.join(ONLY_ANALYSES)))
+        print('  --profile: {}'.format(PROFILE))
         ola = O365LogAnalyzer()
-        ola.perform_analysis(file_name)
+        if args.follow:
+            print('  --threshold: {}'.format(O365_ALERT_THRESHOLD))
+            try:
+                ola.follow(file_names[0])
+            except KeyboardInterrupt:
+                print('* Stopped following {}'.format(file_names[0]))
+        else:
+            ola.perform_analysis(file_names)
     else:
         print('* Example: ')
         print('* {} /path/to/log_file.csv'.format(__file__))
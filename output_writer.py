@@ -0,0 +1,138 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Output Writer: This file writes the analysis outputs as csv, compressed csv or parquet, in the background
+Version: 1.1
+Changelog:
+    v1.1        Background, compressed and columnar outputs
+"""
+import io
+import os
+import gzip
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_loader import lazy_import
+
+zstandard = lazy_import('zstandard')
+
+# Output format -> (file extension, module it needs besides pandas)
+OUTPUT_FORMATS = {'csv': ('.csv', None),
+                  'csv.gz': ('.csv.gz', None),
+                  'csv.zst': ('.csv.zst', 'zstandard'),
+                  'parquet': ('.parquet', 'pyarrow')}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def check_output_format(output_format):
+    """
+    :param output_format: one of OUTPUT_FORMATS
+    :return: None, raises ValueError if the format is unknown or its module is not installed
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("unknown output format '{}', choose among {}".format(output_format,
+                                                                           ', '.join(OUTPUT_FORMATS)))
+    module = OUTPUT_FORMATS[output_format][1]
+    if module is not None and importlib.util.find_spec(module) is None:
+        raise ValueError("output format '{}' needs the '{}' package: pip install {}".format(output_format,
+                                                                                          module, module))
+
+
+def open_csv(path, output_format):
+    """
+    :return: text file to write the csv to, compressed as output_format
+    """
+    if output_format == 'csv.gz':
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_LEVEL)
+    if output_format == 'csv.zst':
+        raw = open(path, 'wb')
+        try:
+            return io.TextIOWrapper(zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw),
+                                    encoding='utf-8', newline='')
+        except:
+            raw.close()
+            raise
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_frame(df, path, output_format, chunk_rows):
+    """
+    Write a frame in chunks of chunk_rows rows, to a temporary file renamed
+    at the end so that a partly written output is never seen
+    :param df: DataFrame
+    :param path: output file with its extension
+    :param output_format: one of OUTPUT_FORMATS
+    :param chunk_rows: rows converted and written at a time, 0 writes the frame at once
+    :return: path
+    """
+    tmp_path = path + '.tmp'
+    chunk_rows = chunk_rows or max(len(df), 1)
+    if output_format == 'parquet':
+        # one row group per chunk
+        df.to_parquet(tmp_path, engine='pyarrow', index=False, row_group_size=chunk_rows)
+    else:
+        with open_csv(tmp_path, output_format) as f:
+            for start in range(0, max(len(df), 1), chunk_rows):
+                df.iloc[start:start + chunk_rows].to_csv(f, index=False, header=start == 0)
+    os.replace(tmp_path, path)
+    return path
+
+
+class OutputWriter:
+    """
+    Writes the analysis outputs on a background thread, so the analyses
+    go on while the previous outputs are compressed and written. Outputs
+    are written in the order they were handed over. Stages running on
+    several threads may hand over outputs at the same time. A frame must
+    not be changed once handed over.
+    """
+    def __init__(self, output_format='csv', chunk_rows=0, background=True):
+        """
+        :param output_format: one of OUTPUT_FORMATS
+        :param chunk_rows: rows written at a time, 0 writes a frame at once
+        :param background: write on a background thread, otherwise write() returns once written
+        """
+        self.output_format = output_format
+        self.chunk_rows = chunk_rows
+        self.background = background
+        self.profiler = None
+        self.executor = None
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def write_output(self, df, path):
+        if self.profiler is None:
+            return write_frame(df, path, self.output_format, self.chunk_rows)
+        with self.profiler.stage('write ' + os.path.basename(path), len(df), type(self).__name__) as record:
+            record['rows_out'] = len(df)
+            return write_frame(df, path, self.output_format, self.chunk_rows)
+
+    def write(self, df, base_name):
+        """
+        :param df: DataFrame
+        :param base_name: output file without extension, eg: OUTPUT_DIR/BlockedTrafficForEachSourceIP_<timestamp>
+        :return: output file, with the extension of the output format
+        """
+        path = base_name + OUTPUT_FORMATS[self.output_format][0]
+        if not self.background:
+            return self.write_output(df, path)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            self.pending.append(self.executor.submit(self.write_output, df, path))
+        return path
+
+    def close(self):
+        """
+        Wait for the outputs still being written
+        :return: list of the files written, raises the error of a failed write
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            executor, self.executor = self.executor, None
+        written = [future.result() for future in pending]
+        if executor is not None:
+            executor.shutdown()
+        return written
@@ -0,0 +1,89 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Stage Executor: This file runs the analysis stages in the order of their dependencies, independent stages concurrently
+Version: 1.1
+Changelog:
+    v1.1        Dependency graph of the analysis stages
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class StageExecutor:
+    """
+    Dependency graph of the stages of an analysis. A stage is a function
+    called with the results of the stages it requires, eg: the analyses
+    of failed logins require the failed login subset, which is computed
+    once and handed to all of them. Stages that do not depend on each
+    other run concurrently on a thread pool. The stages only read the
+    frames they are given, and write their outputs themselves as soon as
+    they are done.
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, name, stage, requires=()):
+        """
+        :param name: stage name
+        :param stage: function, called with the results of the required stages
+        :param requires: names of the stages whose results the stage needs, added before it
+        :return: None
+        """
+        missing = [required for required in requires if required not in self.stages]
+        if missing:
+            raise ValueError("stage '{}' requires stages that were not added before it: {}".format(name, missing))
+        self.stages[name] = (stage, tuple(requires))
+
+    def dependents(self):
+        """
+        :return: dict of the number of stages requiring each stage
+        """
+        counts = {name: 0 for name in self.stages}
+        for _, requires in self.stages.values():
+            for required in requires:
+                counts[required] += 1
+        return counts
+
+    def run(self, n_threads=1):
+        """
+        Run all the stages. The result of a stage is released as soon as
+        all the stages requiring it are done.
+        :param n_threads: number of stages run at the same time, 1 runs them in order
+        :return: None
+        """
+        results = {}
+        pending = self.dependents()
+
+        def done(name, result):
+            results[name] = result
+            for required in self.stages[name][1]:
+                pending[required] -= 1
+                if pending[required] == 0:
+                    del results[required]
+            if pending[name] == 0:
+                del results[name]
+
+        if n_threads <= 1:
+            for name, (stage, requires) in self.stages.items():
+                done(name, stage(*[results[required] for required in requires]))
+            return
+
+        waiting = OrderedDict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            while waiting or running:
+                for name, (stage, requires) in list(waiting.items()):
+                    if all(required in results for required in requires):
+                        del waiting[name]
+                        running[executor.submit(stage, *[results[required] for required in requires])] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BaseException:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    done(name, result)
@@ -0,0 +1,228 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Stage Profiler: This file measures the time, memory and row counts of every analysis stage
+Version: 1.1
+Changelog:
+    v1.1        Per stage profile reports
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except:
+    resource = None  # not available on Windows
+
+from lazy_loader import lazy_import
+
+pd = lazy_import('pandas')
+
+REPORT_COLUMNS = ['analyser', 'stage', 'parent', 'depth', 'status', 'start_s', 'wall_s', 'cpu_s',
+                  'rows_in', 'rows_out', 'alloc_delta_bytes', 'peak_alloc_bytes', 'rss_delta_bytes',
+                  'max_rss_bytes']
+INT_COLUMNS = ['rows_in', 'rows_out', 'alloc_delta_bytes', 'peak_alloc_bytes', 'rss_delta_bytes', 'max_rss_bytes']
+# CPU time of the current thread (python >= 3.7), of the process otherwise
+thread_time = getattr(time, 'thread_time', time.process_time)
+
+
+def max_rss():
+    """
+    :return: peak resident memory of the process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def frame_rows(value):
+    """
+    :return: number of rows of a DataFrame/Series, None for anything else
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(len(value))
+    return None
+
+
+class StageProfiler:
+    """
+    Records the wall time, CPU time, memory and row counts of the stages
+    of a run. Stages may be nested, eg: the GeoIP lookups of an analysis,
+    each record keeps its parent stage. Stages may run on several threads:
+    the CPU time is the time of the thread running the stage, the memory
+    includes the stages running at the same time.
+    Memory: the peak resident memory grows only when a stage goes past the
+    previous peak, so rss_delta_bytes is 0 for most stages. With
+    trace_memory, tracemalloc also gives the memory allocated by the stage
+    and its peak, at the cost of slower stages.
+    """
+    def __init__(self, analyser, output_dir, timestamp, trace_memory=False, cprofile_stage=None):
+        """
+        :param analyser: name of the run, used in the report names
+        :param output_dir: folder of the reports
+        :param timestamp: timestamp of the output files of the run
+        :param trace_memory: measure the memory allocated by every stage with tracemalloc
+        :param cprofile_stage: name of a stage to run under cProfile, None for no cProfile dump
+        """
+        self.analyser = analyser
+        self.output_dir = output_dir
+        self.timestamp = timestamp
+        self.trace_memory = trace_memory
+        self.cprofile_stage = cprofile_stage
+        self.cprofile = None
+        self.cprofile_active = False
+        self.records = []
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        self.started_tracing = False
+
+    @property
+    def stack(self):
+        """
+        :return: stages running on the current thread, outermost first
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name, rows_in=None, analyser=None):
+        """
+        Measure the code run in the with block. rows_out can be set on the
+        yielded record, a failed stage can set its status.
+        :param name: stage name
+        :param rows_in: number of rows the stage works on
+        :param analyser: analyser running the stage (default: the profiler analyser)
+        :return: dict record of the stage
+        """
+        record = {'analyser': analyser or self.analyser, 'stage': name,
+                  'parent': self.stack[-1]['record']['stage'] if self.stack else None,
+                  'depth': len(self.stack), 'status': 'ok', 'rows_in': rows_in, 'rows_out': None,
+                  'alloc_delta_bytes': None, 'peak_alloc_bytes': None}
+        entry = {'record': record}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            self.enter_tracemalloc(entry)
+        profiling = name == self.cprofile_stage and not self.cprofile_active
+        if profiling:
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            self.cprofile_active = True
+        self.stack.append(entry)
+        rss = max_rss()
+        record['start_s'] = round(time.perf_counter() - self.started, 6)
+        wall, cpu = time.perf_counter(), thread_time()
+        if profiling:
+            self.cprofile.enable()
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'error'
+            raise
+        finally:
+            if profiling:
+                self.cprofile.disable()
+                self.cprofile_active = False
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(thread_time() - cpu, 6)
+            self.stack.pop()
+            if self.trace_memory:
+                self.exit_tracemalloc(entry)
+            record['max_rss_bytes'] = max_rss()
+            record['rss_delta_bytes'] = None if rss is None else record['max_rss_bytes'] - rss
+            self.records.append(record)
+
+    def enter_tracemalloc(self, entry):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            # the peak is reset for the nested stage: keep the peak of the parent so far
+            parent = self.stack[-1]
+            parent['peak'] = max(parent['peak'], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        entry['start'] = entry['peak'] = current
+
+    def exit_tracemalloc(self, entry):
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(entry['peak'], peak)
+        entry['record']['alloc_delta_bytes'] = current - entry['start']
+        # python < 3.9 has no reset_peak: the peak is the peak since the tracing started
+        entry['record']['peak_alloc_bytes'] = peak - entry['start']
+        if self.stack:
+            parent = self.stack[-1]
+            parent['peak'] = max(parent['peak'], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def stop(self):
+        """
+        Stop tracemalloc if the profiler started it
+        :return: None
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def report(self):
+        """
+        :return: list of the stage records, in the order the stages started
+        """
+        return sorted(self.records, key=lambda record: record['start_s'])
+
+    def write_report(self):
+        """
+        Write the json and csv reports (and the cProfile dump) to output_dir
+        :return: list of the files written
+        """
+        self.stop()
+        records = [{column: record.get(column) for column in REPORT_COLUMNS} for record in self.report()]
+        base_name = os.path.join(self.output_dir, 'Profile_{}_{}'.format(self.analyser, self.timestamp))
+        report = pd.DataFrame(records, columns=REPORT_COLUMNS)
+        report = report.astype({column: 'Int64' for column in INT_COLUMNS})
+        report.to_csv(base_name + '.csv', index=None)
+        with open(base_name + '.json', 'w') as f:
+            json.dump({'analyser': self.analyser, 'timestamp': self.timestamp,
+                       'total_wall_s': round(time.perf_counter() - self.started, 6),
+                       'trace_memory': self.trace_memory, 'stages': records}, f, indent=2, default=str)
+        files = [base_name + '.json', base_name + '.csv']
+        if self.cprofile is not None:
+            files.append(base_name + '_' + self.cprofile_stage + '.prof')
+            self.cprofile.dump_stats(files[-1])
+        return files
+
+
+def profiled_stage(method):
+    """
+    Record an analyser method as a stage of self.profiler, when the
+    analyser has one. rows_in is the size of the first DataFrame/Series argument
+    or of self.data, rows_out the size of the returned DataFrame, of the
+    first array of a returned tuple of row aligned arrays, or of self.data.
+    A stage returning False is recorded as failed.
+    """
+    @functools.wraps(method)
+    def stage(self, *args, **kwargs):
+        profiler = getattr(self, 'profiler', None)
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        frames = [arg for arg in args if isinstance(arg, (pd.DataFrame, pd.Series))]
+        rows_in = frame_rows(frames[0] if frames else getattr(self, 'data', None))
+        with profiler.stage(method.__name__, rows_in, type(self).__name__) as record:
+            result = method(self, *args, **kwargs)
+            if isinstance(result, tuple) and result and getattr(result[0], 'shape', ()):
+                rows_out = int(result[0].shape[0])
+            else:
+                rows_out = frame_rows(result)
+            record['rows_out'] = frame_rows(getattr(self, 'data', None)) if rows_out is None else rows_out
+            if result is False:
+                record['status'] = 'failed'
+        return result
+    return stage
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_synthetic_logs import generate_firewall_log, generate_o365_log
+
+
+@pytest.fixture(scope='session')
+def firewall_log(tmp_path_factory):
+    # about 30 minutes of skewed traffic, so that many groups have several events in a window
+    return generate_firewall_log(str(tmp_path_factory.mktemp('logs') / 'firewall.csv'), 5000, ips=100,
+                                 hosts=2, days=0.02, skew=1.3, seed=1)
+
+
+@pytest.fixture(scope='session')
+def o365_log(tmp_path_factory):
+    return generate_o365_log(str(tmp_path_factory.mktemp('logs') / 'o365.csv'), 5000, users=50, ips=200,
+                             days=2, seed=1)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from o365_anomalies import O365AnomalyDetector
+from utils import values_by_count
+
+
+def login_patterns(df, dates, users):
+    """
+    Hour wise login patterns the way the per user loop computed them
+    :return: dict of (date, user) -> 24 hour list, for the user-days with a successful hour
+    """
+    patterns = {}
+    for date in dates:
+        day = df[df['login_date'] == date]
+        for user in users:
+            pattern = []
+            for hour in range(24):
+                status = day.loc[(day['user'] == user) & (day['login_hour'] == hour), 'loginStatus'].values
+                pattern.append(int(len(status) > 0 and status[0] == 'Success'))
+            if any(pattern):
+                patterns[(date, user)] = pattern
+    return patterns
+
+
+def detector(data):
+    oad = O365AnomalyDetector()
+    oad.data = data
+    oad.extract_date_hour()
+    oad.login_date = np.sort(oad.data['login_date'].value_counts().index.values)
+    oad.users_list = values_by_count(oad.data['user'])
+    return oad
+
+
+def test_login_pattern_skips_logins_without_user():
+    # the only login at 03:00 has no user: it belongs to no user-day
+    data = pd.DataFrame({'_time': pd.to_datetime(['2020-01-01 03:00', '2020-01-01 04:00', '2020-01-02 01:00',
+                                                  '2020-01-02 05:00', '2020-01-02 06:00']),
+                         'user': pd.Categorical([np.nan, 'a', 'b', 'a', 'b']),
+                         'loginStatus': ['Success', 'Success', 'Success', 'Success', 'Failure']})
+    oad = detector(data)
+    dates, user_codes, matrix = oad.user_login_patterning()
+    patterns = {(date, oad.users_list[code]): list(row) for date, code, row in zip(dates, user_codes, matrix)}
+    assert patterns == login_patterns(oad.data, oad.login_date, oad.users_list)
+    assert not matrix[:, 3].any()
+
+
+def test_login_pattern_on_synthetic_log(o365_log):
+    data = pd.read_csv(o365_log)
+    data['_time'] = pd.to_datetime(data['_time'])
+    data.loc[data.sample(frac=0.05, random_state=0).index, 'user'] = np.nan
+    oad = detector(data.sort_values('_time', kind='stable').reset_index(drop=True))
+    dates, user_codes, matrix = oad.user_login_patterning()
+    patterns = {(date, oad.users_list[code]): list(row) for date, code, row in zip(dates, user_codes, matrix)}
+    assert patterns == login_patterns(oad.data, oad.login_date, oad.users_list)
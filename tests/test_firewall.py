@@ -0,0 +1,32 @@
+import pytest
+
+import firewall_log_analysis
+from firewall_log_analysis import FirewallLogAnalyzer
+
+HEADER = '_time,host,action,dest_ip,dest_port,src_ip\n'
+ROW = '2020-01-01T00:00:00.000+0000,fw1,{},1.1.1.1,22,2.2.2.2\n'
+
+
+def read(file_name, chunk_size, monkeypatch):
+    monkeypatch.setattr(firewall_log_analysis, 'CSV_CHUNK_SIZE', chunk_size)
+    analyzer = FirewallLogAnalyzer()
+    assert analyzer.read_csv_file(file_name)
+    return analyzer
+
+
+@pytest.mark.parametrize('content', [HEADER, HEADER + ROW.format('allowed') * 3,
+                                     HEADER + ROW.format('allowed') + ROW.format('blocked')])
+def test_chunked_read_like_whole_read(tmp_path, monkeypatch, content):
+    log = tmp_path / 'firewall.csv'
+    log.write_text(content)
+    whole, chunked = read(str(log), 0, monkeypatch), read(str(log), 2, monkeypatch)
+    assert chunked.verify_columns() and whole.verify_columns()
+    assert chunked.data.shape == whole.data.shape
+    assert [dtype.name for dtype in chunked.data.dtypes] == [dtype.name for dtype in whole.data.dtypes]
+
+
+def test_chunked_read_rejects_malformed_log(tmp_path, monkeypatch):
+    log = tmp_path / 'firewall.csv'
+    log.write_text(HEADER.replace('\n', ',extra\n') + ROW.format('blocked').replace('\n', ',x\n'))
+    assert not read(str(log), 0, monkeypatch).verify_columns()
+    assert not read(str(log), 2, monkeypatch).verify_columns()
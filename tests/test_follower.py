@@ -0,0 +1,49 @@
+import os
+import time
+import queue
+import threading
+
+import pandas as pd
+
+from log_follower import follow_csv, windowed_alerts
+
+HEADER = '_time,user,ipAddress\n'
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['_time', 'user', 'ipAddress'])
+
+
+def test_alerts_skip_malformed_time():
+    rows = [('2020-01-01T10:00:0{}.000+0000'.format(i), 'a', '1.1.1.1') for i in range(3)]
+    frames = [frame(rows[:2] + [('not a time', 'a', '1.1.1.1')]), frame(rows[2:])]
+    alerts = list(windowed_alerts(frames, ['user', 'ipAddress'], '60s', 3))
+    assert alerts == [(pd.Timestamp('2020-01-01 10:00:02'), ('a', '1.1.1.1'))]
+
+
+def append(file_name, text):
+    with open(file_name, 'a') as f:
+        f.write(text)
+
+
+def test_follow_rotated_file_created_empty(tmp_path):
+    log = str(tmp_path / 'o365.csv')
+    append(log, HEADER)
+    frames = queue.Queue()
+
+    def follow():
+        for rows in follow_csv(log, poll_interval=0.01):
+            frames.put(rows)
+    threading.Thread(target=follow, daemon=True).start()
+    time.sleep(0.5)
+    append(log, '2020-01-01T10:00:00.000+0000,a,1.1.1.1\n')
+    assert frames.get(timeout=10).values.tolist() == [['2020-01-01T10:00:00.000+0000', 'a', '1.1.1.1']]
+    # rotated: the new file is empty for a while before its header is written
+    os.rename(log, log + '.1')
+    append(log, '')
+    time.sleep(0.5)
+    append(log, HEADER)
+    time.sleep(0.5)
+    append(log, '2020-01-01T10:00:01.000+0000,b,2.2.2.2\n')
+    assert frames.get(timeout=10).values.tolist() == [['2020-01-01T10:00:01.000+0000', 'b', '2.2.2.2']]
+    assert frames.empty()
@@ -0,0 +1,97 @@
+import random
+import ipaddress
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ip_index import BlacklistBuilder, BlacklistIndex, ISPBuilder, ISPIndex
+from utils import ip_to_int
+
+
+def random_ip(rng, version):
+    if version == 4:
+        return str(ipaddress.IPv4Address(rng.getrandbits(32)))
+    # keep most IPv6 addresses in a few /16 so that they fall in the test networks
+    return str(ipaddress.IPv6Address((rng.choice([0x2001, 0x2a00, 0xfe80]) << 112) | rng.getrandbits(112)))
+
+
+def random_network(rng, version):
+    prefix = rng.randint(8, 32) if version == 4 else rng.randint(16, 128)
+    return ipaddress.ip_network('{}/{}'.format(random_ip(rng, version), prefix), strict=False)
+
+
+def queries(rng, networks):
+    """
+    Random IPs, the first and last address of every network and their neighbours, and invalid strings
+    """
+    ips = [random_ip(rng, rng.choice([4, 6])) for _ in range(2000)]
+    for network in networks:
+        first, last = int(network.network_address), int(network.broadcast_address)
+        top = 2 ** network.max_prefixlen - 1
+        ips += [str(ipaddress.ip_address(address) if network.version == 6 else ipaddress.IPv4Address(address))
+                for address in (first - 1, first, last, last + 1) if 0 <= address <= top]
+    return ips + ['', 'not an ip', '1.2.3', '256.1.1.1', '::g']
+
+
+def parse(ip):
+    try:
+        return ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+
+
+def test_ip_to_int():
+    rng = random.Random(0)
+    ips = [random_ip(rng, rng.choice([4, 6])) for _ in range(1000)] + ['0.0.0.0', '::', 'bad']
+    version, v4, v6_high, v6_low = ip_to_int(ips)
+    for i, ip in enumerate(ips):
+        address = parse(ip)
+        if address is None:
+            assert version[i] == 0
+        elif address.version == 4:
+            assert (version[i], int(v4[i])) == (4, int(address))
+        else:
+            assert (version[i], (int(v6_high[i]) << 64) | int(v6_low[i])) == (6, int(address))
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_blacklist_index(tmp_path, seed):
+    rng = random.Random(seed)
+    networks = [random_network(rng, rng.choice([4, 6])) for _ in range(200)]
+    # single addresses, as in the blacklist feed
+    networks += [ipaddress.ip_network(random_ip(rng, rng.choice([4, 6]))) for _ in range(200)]
+    builder = BlacklistBuilder()
+    for network in networks:
+        builder.add(str(network))
+    builder.write(str(tmp_path / 'blacklist.idx'))
+    index = BlacklistIndex(str(tmp_path / 'blacklist.idx'))
+    ips = queries(rng, networks)
+    expected = [parse(ip) is not None and any(parse(ip) in network for network in networks) for ip in ips]
+    assert index.contains(ips).tolist() == expected
+    assert index.contains(pd.Series(ips, dtype='category')).tolist() == expected
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_isp_index_longest_prefix(tmp_path, seed):
+    rng = random.Random(seed)
+    networks = []
+    for _ in range(100):
+        network = random_network(rng, rng.choice([4, 6]))
+        # nested prefixes, the most specific one wins
+        networks += [network] + [network.supernet(rng.randint(1, 4)) for _ in range(2)]
+    networks = list(dict.fromkeys(network for network in networks))
+    builder = ISPBuilder()
+    for i, network in enumerate(networks):
+        builder.add(str(network), 'isp{}'.format(i))
+    builder.write(str(tmp_path / 'isp.idx'))
+    index = ISPIndex(str(tmp_path / 'isp.idx'))
+    ips = queries(rng, networks)
+    expected = []
+    for ip in ips:
+        address = parse(ip)
+        matches = [(network.prefixlen, i) for i, network in enumerate(networks)
+                   if address is not None and address in network]
+        expected.append('isp{}'.format(max(matches)[1]) if matches else None)
+    assert list(index.lookup(ips)) == expected
+    assert list(index.lookup(np.asarray(ips, dtype=object))) == expected
@@ -0,0 +1,52 @@
+import os
+import time
+
+import pandas as pd
+
+import log_cache
+from log_cache import ParsedLogCache
+
+
+def entry_size(tmp_path):
+    cache = ParsedLogCache(str(tmp_path / 'size'), 1 << 30)
+    cache.store('entry', pd.DataFrame({'a': range(100)}))
+    return os.path.getsize(cache.path('entry'))
+
+
+def test_evict_leaves_files_being_written(tmp_path):
+    size = entry_size(tmp_path)
+    cache = ParsedLogCache(str(tmp_path / 'cache'), 2 * size)
+    os.makedirs(cache.cache_dir)
+    in_flight = cache.path('other') + '.123.tmp'
+    with open(in_flight, 'wb') as f:
+        f.write(b'0' * 10 * size)
+    cache.store('first', pd.DataFrame({'a': range(100)}))
+    time.sleep(0.01)
+    cache.store('second', pd.DataFrame({'a': range(100)}))
+    # the file another process is writing is neither removed nor counted
+    assert os.access(in_flight, os.F_OK)
+    assert cache.load('first') is not None and cache.load('second') is not None
+    time.sleep(0.01)
+    cache.store('third', pd.DataFrame({'a': range(100)}))
+    assert cache.load('first') is None and cache.load('third') is not None
+
+
+def test_evict_skips_entries_removed_meanwhile(tmp_path, monkeypatch):
+    cache = ParsedLogCache(str(tmp_path / 'cache'), 1 << 30)
+    cache.store('first', pd.DataFrame({'a': range(100)}))
+    cache.max_bytes = 0
+    stat = os.stat
+
+    def removed(path, *args, **kwargs):
+        if path == cache.path('first'):
+            raise FileNotFoundError(path)
+        return stat(path, *args, **kwargs)
+    monkeypatch.setattr(log_cache.os, 'stat', removed)
+    cache.evict()
+    assert cache.load('first') is not None
+    monkeypatch.setattr(log_cache.os, 'stat', stat)
+
+    def removed_meanwhile(path):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(log_cache.os, 'remove', removed_meanwhile)
+    cache.evict()
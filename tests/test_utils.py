@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from utils import detect_time_format, parse_time
+
+
+@pytest.mark.parametrize('values, time_format', [
+    (['2020-01-02T17:22:35.000+0000', '2020-01-02T17:22:36.000+0000'], '%Y-%m-%dT%H:%M:%S.%f%z'),
+    (['2020-01-02 17:22:35', '2020-01-02 17:22:36'], '%Y-%m-%d %H:%M:%S'),
+    (['20200102172235', '20200102172236'], '%Y%m%d%H%M%S'),
+    ([20200102, 20200103], '%Y%m%d'),
+    (['1577985755', '1577985756'], 'epoch_s'),
+    ([1577985755000, 1577985756000], 'epoch_ms'),
+])
+def test_detect_time_format(values, time_format):
+    assert detect_time_format(pd.Series(values)) == time_format
+
+
+def test_parse_compact_times():
+    times = parse_time(pd.Series([20200102172235, 20200103000000]))
+    assert list(times) == [pd.Timestamp('2020-01-02 17:22:35'), pd.Timestamp('2020-01-03')]
+
+
+def test_parse_malformed_time():
+    values = pd.Series(['2020-01-02T17:22:35.000+0000', 'not a time', '2020-01-02T17:22:36.000+0000'])
+    with pytest.raises(ValueError):
+        parse_time(values)
+    times = parse_time(values, errors='coerce')
+    assert times.isna().tolist() == [False, True, False]
+    assert times[2] == pd.Timestamp('2020-01-02T17:22:36.000+0000')
@@ -0,0 +1,90 @@
+import sys
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from utils import windowed_max_count, parse_time
+from window_state import AnalysisState
+
+KEYS = [['src_ip', 'dest_ip', 'dest_port'], ['dest_ip', 'dest_port']]
+
+SHARDED_STAGES = '''
+import sys
+sys.path.insert(0, {root!r})
+import pandas as pd
+from stage_executor import StageExecutor
+from utils import windowed_max_count
+
+if __name__ == '__main__':
+    df = pd.read_csv({log!r})
+    df.index = pd.to_datetime(df['_time'])
+    executor = StageExecutor()
+    executor.add('src', lambda: windowed_max_count(df, ['src_ip', 'dest_ip', 'dest_port'], '60s', 'count', 2))
+    executor.add('dest', lambda: windowed_max_count(df, ['dest_ip', 'dest_port'], '60s', 'count', 2))
+    executor.run(4)
+    print('done')
+'''
+
+
+def test_sharded_stages_on_threads(firewall_log, tmp_path):
+    # --shards 2 with the default ANALYSIS_THREADS: two stages start their process pools at the same time
+    script = tmp_path / 'sharded_stages.py'
+    script.write_text(SHARDED_STAGES.format(root=ROOT, log=firewall_log))
+    for _ in range(3):
+        result = subprocess.run([sys.executable, str(script)], stdout=subprocess.PIPE, timeout=300)
+        assert result.returncode == 0
+        assert result.stdout.decode().strip() == 'done'
+
+
+@pytest.fixture(scope='module')
+def blocked(firewall_log):
+    data = pd.read_csv(firewall_log)
+    data = data.loc[data['action'] == 'blocked', :].copy()
+    data.index = parse_time(data['_time'])
+    data = data.drop('_time', axis=1).sort_index(kind='stable')
+    data['action'] = 1
+    return data
+
+
+def rolling_max_count(df, keys, window_slice, name):
+    """
+    Windowed max count the way the analysers computed it with pandas rolling windows
+    """
+    counts = df.groupby(keys).rolling(window_slice).agg({'action': 'count'}).groupby(keys).max().reset_index()
+    return counts.rename(columns={'action': name})
+
+
+def assert_same_counts(result, expected, keys):
+    result = result.sort_values(keys).reset_index(drop=True)
+    expected = expected.sort_values(keys).reset_index(drop=True)
+    assert result[keys].values.tolist() == expected[keys].values.tolist()
+    assert np.array_equal(result['count'].values, expected['count'].values)
+
+
+@pytest.mark.parametrize('keys', KEYS)
+@pytest.mark.parametrize('window_slice', ['1s', '60s', '600s'])
+def test_windowed_max_count(blocked, keys, window_slice):
+    assert_same_counts(windowed_max_count(blocked, keys, window_slice, 'count'),
+                       rolling_max_count(blocked, keys, window_slice, 'count'), keys)
+
+
+@pytest.mark.parametrize('keys', KEYS)
+def test_sharded_windowed_max_count(blocked, keys):
+    assert_same_counts(windowed_max_count(blocked, keys, '60s', 'count', n_shards=3),
+                       rolling_max_count(blocked, keys, '60s', 'count'), keys)
+
+
+@pytest.mark.parametrize('keys', KEYS)
+def test_incremental_windowed_max_count(blocked, keys, tmp_path):
+    # logs analysed one after the other give the counts of the concatenated log
+    path = str(tmp_path / 'state.pkl')
+    for part in np.array_split(np.arange(blocked.shape[0]), 3):
+        state = AnalysisState(path)
+        state.load()
+        state.check_order(blocked.iloc[part])
+        result = state.windowed_max_count('src_ip', blocked.iloc[part], keys, '60s', 'count')
+        state.save()
+    assert_same_counts(result, rolling_max_count(blocked, keys, '60s', 'count'), keys)
@@ -10,7 +10,39 @@ Changelog:
     v1.1        Final Release
 """
 import os
+import glob
+import shutil
+import tempfile
 import ipaddress
+import multiprocessing
+from itertools import repeat
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from multiprocessing import shared_memory
+except:
+    shared_memory = None  # python < 3.8: the shards are pickled to the workers
+
+from lazy_loader import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Address blocks used for the vectorized IP classification.
+# These follow the ipaddress module (is_private, is_reserved, is_loopback)
+IPV4_PRIVATE_NETWORKS = ['0.0.0.0/8', '10.0.0.0/8', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12',
+                         '192.0.0.0/29', '192.0.0.170/31', '192.0.2.0/24', '192.168.0.0/16', '198.18.0.0/15',
+                         '198.51.100.0/24', '203.0.113.0/24', '240.0.0.0/4', '255.255.255.255/32']
+IPV6_PRIVATE_NETWORKS = ['::1/128', '::/128', '100::/64', '2001::/23', '2001:2::/48', '2001:db8::/32',
+                         '2001:10::/28', 'fc00::/7', 'fe80::/10']
+IPV4_RESERVED_NETWORKS = ['240.0.0.0/4']
+IPV6_RESERVED_NETWORKS = ['::/8', '100::/8', '200::/7', '400::/6', '800::/5', '1000::/4', '4000::/3', '6000::/3',
+                          '8000::/3', 'a000::/3', 'c000::/3', 'e000::/4', 'f000::/5', 'f800::/6', 'fe00::/9']
+IPV4_LOOPBACK_NETWORKS = ['127.0.0.0/8']
+IPV6_LOOPBACK_NETWORKS = ['::1/128']
+
+IPV4_PATTERN = r'^(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})$'
+UINT64_MASK = (1 << 64) - 1
 
 
 def is_dirs(*args):
@@ -47,5 +79,596 @@ def is_ip_private(ip_address):
     return ipaddress.ip_address(ip_address).is_private
 
 
+def read_dtypes(dtypes):
+    """
+    Subset of the column types that pd.read_csv can apply while parsing
+    :param dtypes: FIREWALL_LOG_DTYPES / O365_LOG_DTYPES
+    :return: dict for the dtype argument of pd.read_csv
+    """
+    return {col: dtype for col, dtype in dtypes.items() if dtype == 'category'}
+
+
+def port_column(values):
+    """
+    Store a port column as uint16. Columns with missing or invalid ports
+    are returned unchanged.
+    :param values: Series
+    :return: Series
+    """
+    ports = pd.to_numeric(values, errors='coerce')
+    if ports.notna().all() and ports.between(0, 65535).all() and (ports == ports.round()).all():
+        return ports.astype(np.uint16)
+    return values
+
+
+def apply_schema(df, dtypes):
+    """
+    Cast the log columns to the types declared in config
+    :param df:
+    :param dtypes: FIREWALL_LOG_DTYPES / O365_LOG_DTYPES
+    :return: DataFrame with typed columns
+    """
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'port':
+            df[col] = port_column(df[col])
+        elif df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def values_by_count(series):
+    """
+    Distinct values ordered by descending count, like series.value_counts().index.
+    Dictionary encoded columns are counted on their codes, which keeps equal
+    counts in the same order as for the plain column.
+    :param series:
+    :return: array of values
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = pd.Series(series.cat.codes).value_counts().index.values
+        return series.cat.categories.values[codes[codes >= 0]]
+    return series.value_counts().index.values
+
+
+def plain_values(series):
+    """
+    Dictionary encoded column back to its plain values
+    :param series:
+    :return: Series
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(series.cat.categories.dtype)
+    return series
+
+
+# Timestamp formats accepted by --time-format besides strftime formats.
+# 'epoch_s' and 'epoch_ms' are seconds/milliseconds since 1970-01-01 UTC
+TIME_FORMAT_PRESETS = {'splunk': '%Y-%m-%dT%H:%M:%S.%f%z',
+                       'iso8601': '%Y-%m-%dT%H:%M:%S%z',
+                       'epoch_s': 'epoch_s',
+                       'epoch_ms': 'epoch_ms'}
+# Formats tried, in order, when the format has to be detected
+TIME_FORMAT_CANDIDATES = ['%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d %H:%M:%S.%f%z',
+                          '%Y-%m-%d %H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+                          '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y%m%d%H%M%S', '%Y%m%d%H%M', '%Y%m%d']
+# Digits of the integer part of epoch seconds / milliseconds (1973 - 2286)
+EPOCH_S_DIGITS = (9, 10)
+EPOCH_MS_DIGITS = (12, 13)
+TIME_SAMPLE_SIZE = 1000
+# Below this share of distinct values, only the distinct timestamps are parsed
+TIME_UNIQUE_RATIO = 0.5
+
+
+def resolve_time_format(time_format):
+    """
+    :param time_format: preset name, strftime format or None
+    :return: format understood by parse_time, None to detect it
+    """
+    if not time_format or time_format == 'auto':
+        return None
+    return TIME_FORMAT_PRESETS.get(time_format, time_format)
+
+
+def detect_time_format(values):
+    """
+    Detect the timestamp format from a sample of the column
+    :param values: Series of timestamp strings/numbers
+    :return: format for parse_time, None if no known format matches
+    """
+    sample = values.dropna()
+    sample = sample.iloc[:TIME_SAMPLE_SIZE].astype(str).str.strip()
+    if sample.empty:
+        return None
+    digits = sample.str.extract(r'^(\d+)(?:\.\d+)?$', expand=False)
+    if digits.notna().all():
+        # other all-digit values are compact dates, eg: 20200101123000
+        lengths = digits.str.len()
+        if lengths.between(*EPOCH_S_DIGITS).all():
+            return 'epoch_s'
+        if lengths.between(*EPOCH_MS_DIGITS).all():
+            return 'epoch_ms'
+    for time_format in TIME_FORMAT_CANDIDATES:
+        try:
+            pd.to_datetime(sample, format=time_format)
+            return time_format
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def _to_datetime(values, time_format, errors='raise'):
+    if time_format in ('epoch_s', 'epoch_ms'):
+        unit = 's' if time_format == 'epoch_s' else 'ms'
+        times = pd.to_datetime(pd.to_numeric(values, errors=errors), unit=unit, utc=True)
+        return times.astype('datetime64[ns, UTC]')
+    if time_format is not None and pd.api.types.is_numeric_dtype(values):
+        # compact dates read as numbers, eg: 20200101
+        values = values.astype(str)
+    try:
+        return pd.to_datetime(values, format=time_format)
+    except (ValueError, TypeError):
+        # rows the sampled/given format does not cover: fall back to inference
+        return pd.to_datetime(values, errors=errors)
+
+
+def parse_time(values, time_format=None, errors='raise'):
+    """
+    Parse a timestamp column with a fixed format instead of inferring the
+    format of each element. When few timestamps are distinct, only the
+    distinct values are parsed.
+    :param values: Series of timestamp strings/numbers
+    :param time_format: preset name, strftime format or None to detect it
+    :param errors: 'raise' on a timestamp that cannot be parsed, 'coerce' to NaT
+    :return: datetime Series
+    """
+    time_format = resolve_time_format(time_format)
+    if time_format is None:
+        time_format = detect_time_format(values)
+    codes, uniques = pd.factorize(values)
+    if 0 < len(uniques) < TIME_UNIQUE_RATIO * len(values):
+        times = _to_datetime(pd.Series(uniques), time_format, errors)
+        parsed = times.take(np.where(codes < 0, 0, codes))
+        parsed.index = values.index
+        parsed.name = values.name
+        return parsed.where(codes >= 0) if (codes < 0).any() else parsed
+    return _to_datetime(values, time_format, errors)
+
+
+def sort_by_column(df, column):
+    """
+    Sort by the column, skipping the sort when it is already in order
+    :param df:
+    :param column:
+    :return: sorted DataFrame
+    """
+    if df[column].is_monotonic_increasing:
+        return df
+    return df.sort_values(by=column)
+
+
+def process_pool(max_workers):
+    """
+    Process pool whose workers are not forked from the current process.
+    The analyses run on threads (StageExecutor) next to the background
+    output writer, and forking a multithreaded process can copy a lock
+    held by another thread into the child, which then hangs.
+    The workers get their arguments pickled, settings included.
+    :param max_workers: number of worker processes
+    :return: ProcessPoolExecutor
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+
+
+def expand_file_names(patterns):
+    """
+    Expand the glob patterns among the given file names, eg: 'logs/fw_*.csv'
+    :param patterns: list of file names / glob patterns
+    :return: list of file names, each pattern expanded in sorted order
+    """
+    file_names = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            file_names.extend(sorted(glob.glob(pattern)))
+        else:
+            file_names.append(pattern)
+    return file_names
+
+
+def select_analyses(only, analyses):
+    """
+    Validate the analyses selected with --only
+    :param only: comma separated analysis names, eg: 'src,dest', None for all of them
+    :param analyses: names of the analyses of the analyser
+    :return: list of the selected analyses, in the order of analyses
+    """
+    if only is None:
+        return list(analyses)
+    selected = [name.strip() for name in only.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in analyses]
+    if unknown or not selected:
+        raise ValueError("unknown analysis '{}', choose among {}".format(','.join(unknown), ','.join(analyses)))
+    return [name for name in analyses if name in selected]
+
+
+def load_log_files(load_file, file_names, settings, n_jobs):
+    """
+    Call load_file(file_name, settings) for every file, on n_jobs worker processes
+    :param load_file: module level function, so it can run in worker processes
+    :param file_names:
+    :param settings: dict of the settings the workers need, eg: TIME_FORMAT
+    :param n_jobs: number of worker processes
+    :return: list of the results, in the order of file_names
+    """
+    if n_jobs > 1 and len(file_names) > 1:
+        with process_pool(min(n_jobs, len(file_names))) as executor:
+            return list(executor.map(load_file, file_names, repeat(settings)))
+    return [load_file(file_name, settings) for file_name in file_names]
+
+
+def concat_frames(frames):
+    """
+    Concatenate frames read from different files. Dictionary encoded columns
+    stay dictionary encoded, with the sorted union of the categories.
+    :param frames: list of DataFrames with the same columns
+    :return: DataFrame
+    """
+    frames = list(frames)
+    for col in frames[0].columns:
+        if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = pd.api.types.union_categoricals([frame[col] for frame in frames],
+                                                         sort_categories=True).categories
+            frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) for frame in frames]
+    return pd.concat(frames, sort=False)
+
+
+def merge_time_sorted(frames, column=None):
+    """
+    Merge frames that are each sorted by time into one time sorted frame.
+    The concatenated frames are runs of sorted times, which the stable sort
+    (timsort) merges run by run rather than sorting from scratch. Frames that
+    follow each other in time, like hourly exports, are not reordered at all.
+    Rows with equal times keep the order of the frames.
+    :param frames: list of DataFrames sorted by time
+    :param column: time column, None for a DatetimeIndex
+    :return: DataFrame sorted by time
+    """
+    data = concat_frames(frames)
+    times = data.index.values if column is None else data[column].values
+    times = np.asarray(times, dtype='datetime64[ns]')
+    # missing times go last, like sort_values
+    times = np.where(np.isnat(times), np.iinfo(np.int64).max, times.view(np.int64))
+    if times.size and (times[1:] < times[:-1]).any():
+        data = data.iloc[np.argsort(times, kind='stable')]
+    if column is not None:
+        data = data.reset_index(drop=True)
+    return data
+
+
+def ip_to_int(ips):
+    """
+    Parse a column of IP address strings into packed integers.
+    IPv4 addresses are parsed in bulk into uint32. IPv6 addresses are
+    stored as the high and low uint64 halves of their 128 bit value;
+    only the distinct IPv6 strings go through the ipaddress module.
+    :param ips: array/Series of IP address strings
+    :return: (version, v4, v6_high, v6_low); version is 4, 6 or 0 if invalid
+    """
+    ips = pd.Series(np.asarray(ips, dtype=object)).astype(str)
+    n = ips.shape[0]
+    version = np.zeros(n, dtype=np.uint8)
+    v4 = np.zeros(n, dtype=np.uint32)
+    v6_high = np.zeros(n, dtype=np.uint64)
+    v6_low = np.zeros(n, dtype=np.uint64)
+
+    octets = ips.str.extract(IPV4_PATTERN).astype(np.float64).values
+    is_v4 = ~np.isnan(octets).any(axis=1) & (np.nan_to_num(octets) <= 255).all(axis=1)
+    octets = np.nan_to_num(octets[is_v4]).astype(np.uint32)
+    v4[is_v4] = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    version[is_v4] = 4
+
+    maybe_v6 = ~is_v4 & ips.str.contains(':', regex=False).values
+    if maybe_v6.any():
+        codes, uniques = pd.factorize(ips.values[maybe_v6])
+        parsed = np.zeros((len(uniques), 3), dtype=np.uint64)
+        for i, ip in enumerate(uniques):
+            try:
+                value = int(ipaddress.IPv6Address(ip))
+            except ValueError:
+                continue
+            parsed[i] = (6, value >> 64, value & UINT64_MASK)
+        parsed = parsed[codes]
+        version[maybe_v6] = parsed[:, 0]
+        v6_high[maybe_v6] = parsed[:, 1]
+        v6_low[maybe_v6] = parsed[:, 2]
+    return version, v4, v6_high, v6_low
+
+
+@lru_cache(maxsize=None)
+def network_bounds(network):
+    """
+    First and last address of a network as integers
+    :param network: eg: '10.0.0.0/8'
+    :return: (start, end)
+    """
+    network = ipaddress.ip_network(network)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def ip_class_mask(ips, v4_networks, v6_networks, map_v4=False):
+    """
+    Vectorized membership of a column of IP addresses in address blocks,
+    done with range comparisons on the packed integers.
+    :param ips: array/Series of IP address strings
+    :param v4_networks: list of IPv4 networks
+    :param v6_networks: list of IPv6 networks
+    :param map_v4: check IPv4 mapped IPv6 addresses (::ffff:a.b.c.d) as their IPv4 address
+    :return: boolean array, False for invalid addresses
+    """
+    version, v4, v6_high, v6_low = ip_to_int(ips)
+    mapped = (version == 6) & (v6_high == 0) & ((v6_low >> np.uint64(32)) == 0xffff) & map_v4
+    v4 = np.where(mapped, (v6_low & np.uint64(0xffffffff)).astype(np.uint32), v4)
+    is_v4 = (version == 4) | mapped
+    is_v6 = (version == 6) & ~mapped
+    mask = np.zeros(version.shape[0], dtype=bool)
+    for network in v4_networks:
+        start, end = network_bounds(network)
+        mask |= is_v4 & (v4 >= start) & (v4 <= end)
+    for network in v6_networks:
+        start, end = network_bounds(network)
+        start_high, start_low = np.uint64(start >> 64), np.uint64(start & UINT64_MASK)
+        end_high, end_low = np.uint64(end >> 64), np.uint64(end & UINT64_MASK)
+        above = (v6_high > start_high) | ((v6_high == start_high) & (v6_low >= start_low))
+        below = (v6_high < end_high) | ((v6_high == end_high) & (v6_low <= end_low))
+        mask |= is_v6 & above & below
+    return mask
+
+
+def private_ip_mask(ips):
+    """
+    Vectorized is_ip_private over a column of IP addresses
+    :param ips:
+    :return: boolean array, True for Private IPs
+    """
+    return ip_class_mask(ips, IPV4_PRIVATE_NETWORKS, IPV6_PRIVATE_NETWORKS, map_v4=True)
+
+
+def reserved_ip_mask(ips):
+    """
+    Vectorized check for IETF reserved IP addresses
+    :param ips:
+    :return: boolean array, True for reserved IPs
+    """
+    return ip_class_mask(ips, IPV4_RESERVED_NETWORKS, IPV6_RESERVED_NETWORKS)
+
+
+def loopback_ip_mask(ips):
+    """
+    Vectorized check for loopback IP addresses
+    :param ips:
+    :return: boolean array, True for loopback IPs
+    """
+    return ip_class_mask(ips, IPV4_LOOPBACK_NETWORKS, IPV6_LOOPBACK_NETWORKS)
+
+
+def max_window_counts(codes, times, window):
+    """
+    Peak number of events that fall in one time window, for every group.
+    Windows are closed on the right, (t - window, t], like pandas time based
+    rolling windows. One sort and a couple of searchsorted calls replace the
+    per row rolling result.
+    :param codes: int64 array of dense group codes
+    :param times: int64 array of event times in nanoseconds
+    :param window: window length in nanoseconds
+    :return: (group codes in ascending order, peak count of each group)
+    """
+    if codes.size == 0:
+        return codes, np.zeros(0, dtype=np.int64)
+    order = np.lexsort((times, codes))
+    codes = codes[order]
+    times = times[order]
+    # rank the timestamps so (group, time) packs into a single sorted int64 key
+    unique_times = np.unique(times)
+    span = unique_times.size + 1
+    time_rank = np.searchsorted(unique_times, times)
+    low_rank = np.searchsorted(unique_times, times - window, side='right')
+    key = codes * span + time_rank
+    start = np.searchsorted(key, codes * span + low_rank, side='left')
+    counts = np.arange(codes.size) - start + 1
+    group_start = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return codes[group_start], np.maximum.reduceat(counts, group_start)
+
+
+class SharedArrays:
+    """
+    Numpy arrays copied once into shared memory, so that worker processes
+    can read them without pickling. Used as a context manager, the shared
+    memory is released on exit. Without multiprocessing.shared_memory the
+    arrays themselves are handed to the workers.
+    """
+    def __init__(self, *arrays):
+        self.blocks = []
+        self.specs = []
+        for array in arrays:
+            if shared_memory is None:
+                self.specs.append(array)
+                continue
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.specs.append((block.name, array.shape, array.dtype.str))
+
+    def __enter__(self):
+        return self.specs
+
+    def __exit__(self, *exc):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def attach_shared_arrays(specs):
+    """
+    :param specs: SharedArrays specs
+    :return: (arrays, shared memory blocks to close once the arrays are no longer used)
+    """
+    arrays = []
+    blocks = []
+    for spec in specs:
+        if isinstance(spec, np.ndarray):
+            arrays.append(spec)
+            continue
+        name, shape, dtype = spec
+        block = shared_memory.SharedMemory(name=name)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        blocks.append(block)
+    return arrays, blocks
+
+
+def shard_max_window_counts(specs, start, stop, window):
+    """
+    max_window_counts of the rows [start, stop) of the shared codes and
+    times. Kept at module level so it can run in worker processes.
+    :param specs: SharedArrays specs of (codes, times)
+    :param start:
+    :param stop:
+    :param window: window length in nanoseconds
+    :return: (group codes, peak count of each group)
+    """
+    (codes, times), blocks = attach_shared_arrays(specs)
+    try:
+        group, counts = max_window_counts(codes[start:stop].copy(), times[start:stop].copy(), window)
+    finally:
+        del codes, times
+        for block in blocks:
+            block.close()
+    return group, counts
+
+
+def sharded_max_window_counts(codes, times, window, n_shards):
+    """
+    max_window_counts computed on n_shards processes. Groups are independent,
+    so the rows are partitioned by a hash of the group (the group code modulo
+    n_shards), laid out shard after shard in shared memory, and every worker
+    counts the windows of its own slice.
+    :param codes: int64 array of dense group codes
+    :param times: int64 array of event times in nanoseconds
+    :param window: window length in nanoseconds
+    :param n_shards: number of shards / worker processes
+    :return: (group codes in ascending order, peak count of each group)
+    """
+    if n_shards <= 1 or codes.size == 0:
+        return max_window_counts(codes, times, window)
+    shards = codes % n_shards
+    order = np.argsort(shards, kind='stable')
+    bounds = np.searchsorted(shards[order], np.arange(n_shards + 1))
+    n_groups = codes.max() + 1
+    peaks = np.zeros(n_groups, dtype=np.int64)
+    with SharedArrays(codes[order], times[order]) as specs:
+        with process_pool(n_shards) as executor:
+            results = executor.map(shard_max_window_counts, repeat(specs), bounds[:-1], bounds[1:], repeat(window))
+            for group, counts in results:
+                peaks[group] = counts
+    present = np.zeros(n_groups, dtype=bool)
+    present[codes] = True
+    return np.flatnonzero(present), peaks[present]
+
+
+def group_codes(df, keys):
+    """
+    Dense group codes for the given key columns, numbered in the same
+    sorted order that groupby(keys) uses.
+    :param df:
+    :param keys: list of column names
+    :return: int64 array of codes
+    """
+    codes = np.zeros(df.shape[0], dtype=np.int64)
+    for key in keys:
+        key_codes, uniques = pd.factorize(df[key], sort=True)
+        codes = codes * len(uniques) + key_codes
+        codes = np.unique(codes, return_inverse=True)[1].reshape(-1).astype(np.int64)
+    return codes
+
+
+def windowed_max_count(df, keys, window_slice, name, n_shards=1):
+    """
+    Maximum count of events per group within the time window. Gives the same
+    result as df.groupby(keys).rolling(window_slice).count().groupby(keys).max()
+    on a DataFrame indexed by time.
+    :param df: DataFrame with a DatetimeIndex
+    :param keys: list of group columns
+    :param window_slice: time window, eg: '60s'
+    :param name: name of the count column
+    :param n_shards: number of processes counting the windows
+    :return: DataFrame with the keys and the max count, sorted by keys
+    """
+    df = df[keys].dropna()
+    times = np.asarray(df.index.values, dtype='datetime64[ns]').view(np.int64)
+    window = pd.Timedelta(window_slice).value
+    codes = group_codes(df, keys)
+    first_row = np.zeros(0, dtype=np.int64)
+    if codes.size:
+        first_row = np.unique(codes, return_index=True)[1]
+    _, counts = sharded_max_window_counts(codes, times, window, n_shards)
+    result = df.iloc[first_row].reset_index(drop=True)
+    for key in keys:
+        # one row per group: give the keys back as plain values
+        result[key] = plain_values(result[key])
+    result[name] = counts.astype(np.float64)
+    return result
+
+
+class ResultCollector:
+    """
+    Collects result frames produced group by group and builds the output
+    with a single concatenation, instead of growing a DataFrame on every
+    group. When the buffered rows pass spill_rows, the buffer is written to
+    a temporary file and released.
+    """
+    def __init__(self, columns, spill_rows=0):
+        """
+        :param columns: output columns
+        :param spill_rows: buffered rows that trigger a spill to disk, 0 never spills
+        """
+        self.columns = columns
+        self.spill_rows = spill_rows
+        self.frames = []
+        self.rows = 0
+        self.spill_dir = None
+        self.spill_files = []
+
+    def add(self, df):
+        if df is None or df.shape[0] == 0:
+            return
+        self.frames.append(df[self.columns])
+        self.rows += df.shape[0]
+        if self.spill_rows and self.rows >= self.spill_rows:
+            self.spill()
+
+    def spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='loganalyser_')
+        spill_file = os.path.join(self.spill_dir, 'part{}.pkl'.format(len(self.spill_files)))
+        pd.concat(self.frames).to_pickle(spill_file)
+        self.spill_files.append(spill_file)
+        self.frames = []
+        self.rows = 0
+
+    def to_frame(self):
+        """
+        :return: DataFrame of all the collected rows, in the order they were added
+        """
+        frames = [pd.read_pickle(spill_file) for spill_file in self.spill_files] + self.frames
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self.spill_files = []
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+
 if __name__ == '__main__':
     print('*** Cannot execute util file! ***')
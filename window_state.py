@@ -0,0 +1,180 @@
+"""
+Copyright© Anlyz Inc.,
+Log analyser analyses csv logs with a particular format to provide security analytics.
+Window State: This file keeps the windowed counts of the logs analysed so far, for the incremental mode
+Version: 1.1
+Changelog:
+    v1.1        Persisted window state across log files
+"""
+import os
+
+from lazy_loader import lazy_import
+from utils import group_codes, max_window_counts, plain_values
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Bump when the state layout changes, so that older states are not used
+STATE_VERSION = 1
+TIME_COLUMN = '_time_ns'
+
+
+def event_times(df):
+    """
+    :param df: DataFrame with a DatetimeIndex
+    :return: int64 array of event times in nanoseconds
+    """
+    return np.asarray(df.index.values, dtype='datetime64[ns]').view(np.int64)
+
+
+class WindowState:
+    """
+    State of one windowed count: the running max count of every group and
+    the events that may still fall in a window together with later events,
+    ie: the events after (last event time - window).
+    """
+    def __init__(self, keys, window):
+        """
+        :param keys: list of group columns
+        :param window: window length in nanoseconds
+        """
+        self.keys = list(keys)
+        self.window = window
+        self.dtypes = {}
+        self.groups = pd.DataFrame({'max_count': np.zeros(0, dtype=np.int64)})
+        self.tail = pd.DataFrame({TIME_COLUMN: np.zeros(0, dtype=np.int64)})
+        for key in self.keys:
+            self.groups.insert(len(self.groups.columns) - 1, key, pd.Series(dtype=object))
+            self.tail.insert(len(self.tail.columns) - 1, key, pd.Series(dtype=object))
+
+    def update(self, df):
+        """
+        Add the events of a new log. The log must not start before the end
+        of the logs already added.
+        :param df: DataFrame with a DatetimeIndex and the key columns
+        :return: None
+        """
+        df = df[self.keys].dropna()
+        new_events = pd.DataFrame({key: plain_values(df[key]).reset_index(drop=True) for key in self.keys})
+        new_events[TIME_COLUMN] = event_times(df)
+        if not new_events.empty:
+            # key types of the latest log, the result is given back with them
+            self.dtypes = new_events[self.keys].dtypes.to_dict()
+        events = pd.concat([self.tail, new_events], ignore_index=True, sort=False)
+        if events.empty:
+            return
+        times = events[TIME_COLUMN].values.astype(np.int64)
+        codes = group_codes(events, self.keys)
+        _, counts = max_window_counts(codes, times, self.window)
+        first_row = np.unique(codes, return_index=True)[1]
+        peaks = events.iloc[first_row][self.keys].reset_index(drop=True)
+        peaks['max_count'] = counts
+
+        groups = pd.concat([self.groups, peaks], ignore_index=True, sort=False)
+        codes = group_codes(groups, self.keys)
+        max_count = np.zeros(codes.max() + 1, dtype=np.int64)
+        np.maximum.at(max_count, codes, groups['max_count'].values.astype(np.int64))
+        first_row = np.unique(codes, return_index=True)[1]
+        self.groups = groups.iloc[first_row].reset_index(drop=True)
+        self.groups['max_count'] = max_count
+
+        self.tail = events.loc[times > times.max() - self.window].reset_index(drop=True)
+
+    def result(self, name):
+        """
+        :param name: name of the count column
+        :return: DataFrame with the keys and the max count, sorted by keys
+        """
+        result = self.groups[self.keys].copy()
+        for key, dtype in self.dtypes.items():
+            result[key] = result[key].astype(dtype)
+        result[name] = self.groups['max_count'].values.astype(np.float64)
+        return result
+
+
+class AnalysisState:
+    """
+    Window states of all the windowed analyses of one analyser, stored in
+    a single file so that a run updates all of them or none of them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.last_time = None
+        self.windows = {}
+        self.counts = {}
+
+    def load(self):
+        """
+        :return: True if a state was found
+        """
+        if not os.access(self.path, os.F_OK):
+            return False
+        state = pd.read_pickle(self.path)
+        if state.get('version') != STATE_VERSION:
+            print("* State '{}' was written by another version, starting over...".format(self.path))
+            return False
+        self.last_time = state['last_time']
+        self.windows = state['windows']
+        self.counts = state['counts']
+        return True
+
+    def save(self):
+        state = {'version': STATE_VERSION, 'last_time': self.last_time,
+                 'windows': self.windows, 'counts': self.counts}
+        state_dir = os.path.dirname(self.path)
+        if not os.access(state_dir, os.F_OK):
+            os.makedirs(state_dir)
+        tmp_path = self.path + '.tmp'
+        pd.to_pickle(state, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def check_order(self, df):
+        """
+        Refuse a log that starts before the end of the logs already analysed,
+        the running counts would be wrong otherwise.
+        :param df: DataFrame with a DatetimeIndex
+        :return: None
+        """
+        times = event_times(df)
+        if times.size == 0:
+            return
+        if self.last_time is not None and times.min() < self.last_time:
+            raise ValueError("log starts at {}, before the end of the logs already analysed ({}). "
+                             "Remove '{}' to start over".format(pd.Timestamp(times.min()),
+                                                                pd.Timestamp(self.last_time), self.path))
+        self.last_time = times.max()
+
+    def windowed_max_count(self, state_name, df, keys, window_slice, name):
+        """
+        Same as utils.windowed_max_count, over all the logs analysed so far
+        :param state_name: name the state is stored under
+        :param df: DataFrame with a DatetimeIndex, rows of the new log
+        :param keys: list of group columns
+        :param window_slice: time window, eg: '60s'
+        :param name: name of the count column
+        :return: DataFrame with the keys and the max count, sorted by keys
+        """
+        window = pd.Timedelta(window_slice).value
+        state = self.windows.get(state_name)
+        if state is None:
+            state = self.windows[state_name] = WindowState(keys, window)
+        elif state.keys != list(keys) or state.window != window:
+            raise ValueError("'{}' was counted with another window or keys. "
+                             "Remove '{}' to start over".format(state_name, self.path))
+        state.update(df)
+        return state.result(name)
+
+    def cumulative_count(self, state_name, counts):
+        """
+        Add the counts of the new log to the counts of the logs analysed so far
+        :param state_name: name the state is stored under
+        :param counts: Series of counts indexed by group
+        :return: Series of counts
+        """
+        if isinstance(counts.index.dtype, pd.CategoricalDtype):
+            counts.index = counts.index.astype(counts.index.categories.dtype)
+        previous = self.counts.get(state_name)
+        if previous is not None:
+            counts = pd.concat([previous, counts]).groupby(level=0, sort=False).sum()
+        self.counts[state_name] = counts
+        return counts